@@ -1,104 +1,215 @@
-import streamlit as st
-import requests
-import uuid
-import PyPDF2
-from io import BytesIO
-from dotenv import load_dotenv
-import os
-
-# Load environment variables from .env file if needed
-load_dotenv()
-
-def translate_text(text, from_lang='en', to_lang='hi'):
-    # Your endpoint and subscription key
-    endpoint = "https://ai-aihackthonhub282549186415.cognitiveservices.azure.com/translator/text/v3.0/translate"
-    subscription_key = "Fj1KPt7grC6bAkNja7daZUstpP8wZTXsV6Zjr2FOxkO7wsBQ5SzQJQQJ99BCACHYHv6XJ3w3AAAAACOGL3Xg"
-    
-    # Set up the headers with subscription key
-    headers = {
-        'Ocp-Apim-Subscription-Key': subscription_key,
-        'Content-type': 'application/json',
-        'X-ClientTraceId': str(uuid.uuid4())
-    }
-    
-    # Set up the query parameters
-    params = {
-        'api-version': '3.0',
-        'from': from_lang,
-        'to': to_lang
-    }
-    
-    # Set up the request body
-    body = [{
-        'text': text
-    }]
-    
-    # Make the API request
-    try:
-        response = requests.post(endpoint, headers=headers, params=params, json=body)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
-        # Parse the JSON response
-        result = response.json()
-        
-        # Extract and return the translated text
-        translations = result[0]['translations']
-        translated_text = translations[0]['text']
-        
-        return {
-            'original_text': text,
-            'translated_text': translated_text,
-            'from_language': from_lang,
-            'to_language': to_lang,
-            'full_response': result
-        }
-    
-    except requests.exceptions.HTTPError as http_err:
-        st.error(f"HTTP error occurred: {http_err}")
-        return {"error": str(http_err)}
-    except Exception as err:
-        st.error(f"An error occurred: {err}")
-        return {"error": str(err)}
-
-st.title("Document Translator")
-
-st.write("Upload a document (PDF or plain text) to translate its content into Hindi.")
-
-# File uploader accepts PDFs and plain text files.
-uploaded_file = st.file_uploader("Choose a file", type=["pdf", "txt"])
-
-# Allow user to enter the target language code; default is now "hi" for Hindi.
-target_language = st.text_input("Enter target language code (default is 'hi' for Hindi)", "hi")
-
-if uploaded_file is not None:
-    file_extension = uploaded_file.name.split(".")[-1].lower()
-    extracted_text = ""
-    
-    if file_extension == "pdf":
-        try:
-            # Use PyPDF2 to extract text from PDF
-            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    extracted_text += page_text + "\n"
-        except Exception as e:
-            st.error("Error reading PDF file: " + str(e))
-    elif file_extension == "txt":
-        try:
-            extracted_text = uploaded_file.read().decode("utf-8")
-        except Exception as e:
-            st.error("Error reading text file: " + str(e))
-    
-    if extracted_text:
-        st.subheader("Extracted Text:")
-        st.write(extracted_text)
-        
-        st.info("Translating text into Hindi...")
-        translation_result = translate_text(extracted_text, from_lang="en", to_lang=target_language)
-        
-        if "error" in translation_result:
-            st.error("Translation failed: " + translation_result["error"])
-        else:
-            st.subheader("Translated Text:")
-            st.write(translation_result["translated_text"])
+import streamlit as st
+import requests
+import uuid
+from io import BytesIO
+from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from pdf_pages import iter_page_texts
+
+# Load environment variables from .env file if needed
+load_dotenv()
+
+# Translator v3 accepts at most 1000 elements and 50,000 characters per request
+TRANSLATOR_MAX_ELEMENTS = 1000
+TRANSLATOR_MAX_CHARS = 50000
+# Paragraphs longer than this are split between sentences; shorter segments cache better
+TRANSLATOR_SEGMENT_CHARS = int(os.getenv("TRANSLATOR_SEGMENT_CHARS", "5000"))
+TRANSLATOR_CONCURRENCY = int(os.getenv("TRANSLATOR_CONCURRENCY", "4"))
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", ".translation_cache.sqlite")
+AZURE_TRANSLATOR_ENDPOINT = os.getenv("AZURE_TRANSLATOR_ENDPOINT", "https://ai-aihackthonhub282549186415.cognitiveservices.azure.com/translator/text/v3.0/translate")
+AZURE_TRANSLATOR_KEY = os.getenv("AZURE_TRANSLATOR_KEY")
+
+# Separators are captured so that split() keeps them and the text can be put back together exactly
+PARAGRAPH_BREAK = re.compile(r"(\s*\n\s*\n\s*)")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?\u0964])(\s+)")
+
+class TranslationCache:
+    """Translated segments keyed by (SHA-256 of the text, from, to), kept in SQLite across runs."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "text_hash TEXT, from_lang TEXT, to_lang TEXT, translation TEXT, "
+            "PRIMARY KEY (text_hash, from_lang, to_lang))"
+        )
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts, from_lang, to_lang):
+        found = {}
+        with self.lock:
+            for text in texts:
+                row = self.connection.execute(
+                    "SELECT translation FROM translations WHERE text_hash = ? AND from_lang = ? AND to_lang = ?",
+                    (self.text_hash(text), from_lang, to_lang),
+                ).fetchone()
+                if row:
+                    found[text] = row[0]
+        return found
+
+    def put_many(self, translations, from_lang, to_lang):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                [(self.text_hash(text), from_lang, to_lang, translation) for text, translation in translations.items()],
+            )
+
+@st.cache_resource
+def get_translation_cache():
+    return TranslationCache(TRANSLATION_CACHE_PATH)
+
+def split_for_translation(text, max_chars=TRANSLATOR_SEGMENT_CHARS):
+    """
+    Splits text into (piece, translate) pairs on paragraph breaks, then sentence breaks for long
+    paragraphs, then hard cuts for sentences that are still too long. Joining every piece,
+    translated or not, gives back the original text.
+    """
+    pieces = []
+    for index, paragraph in enumerate(PARAGRAPH_BREAK.split(text)):
+        if index % 2 or not paragraph.strip():
+            pieces.append((paragraph, False))
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append((paragraph, True))
+            continue
+        for sentence_index, sentence in enumerate(SENTENCE_BREAK.split(paragraph)):
+            if sentence_index % 2:
+                pieces.append((sentence, False))
+                continue
+            for start in range(0, len(sentence), max_chars):
+                pieces.append((sentence[start:start + max_chars], True))
+    return pieces
+
+def pack_batches(segments, max_chars=TRANSLATOR_MAX_CHARS, max_elements=TRANSLATOR_MAX_ELEMENTS):
+    batches = []
+    batch = []
+    batch_chars = 0
+    for segment in segments:
+        if batch and (batch_chars + len(segment) > max_chars or len(batch) == max_elements):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(segment)
+        batch_chars += len(segment)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def translate_batch(segments, from_lang, to_lang):
+    if not AZURE_TRANSLATOR_KEY:
+        raise RuntimeError("AZURE_TRANSLATOR_KEY is not set; add your Translator subscription key to the environment or .env")
+
+    # Set up the headers with subscription key
+    headers = {
+        'Ocp-Apim-Subscription-Key': AZURE_TRANSLATOR_KEY,
+        'Content-type': 'application/json',
+        'X-ClientTraceId': str(uuid.uuid4())
+    }
+    
+    # Set up the query parameters
+    params = {
+        'api-version': '3.0',
+        'from': from_lang,
+        'to': to_lang
+    }
+    
+    # One body element per segment; the response lists translations in the same order
+    body = [{'text': segment} for segment in segments]
+    response = requests.post(AZURE_TRANSLATOR_ENDPOINT, headers=headers, params=params, json=body)
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    return response.json()
+
+def translate_text(text, from_lang='en', to_lang='hi'):
+    """
+    Translates text of any length: segments already in the cache are reused, and the rest are
+    packed into requests under the Translator limits, sent concurrently and put back in order.
+    """
+    try:
+        pieces = split_for_translation(text)
+        segments = list(dict.fromkeys(piece for piece, translate in pieces if translate))
+        cache = get_translation_cache()
+        translations = cache.get_many(segments, from_lang, to_lang)
+        missing = [segment for segment in segments if segment not in translations]
+
+        result = []
+        batches = pack_batches(missing)
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(TRANSLATOR_CONCURRENCY, len(batches))) as executor:
+                for batch, batch_result in zip(batches, executor.map(lambda batch: translate_batch(batch, from_lang, to_lang), batches)):
+                    result.extend(batch_result)
+                    new_translations = {segment: item['translations'][0]['text'] for segment, item in zip(batch, batch_result)}
+                    translations.update(new_translations)
+                    cache.put_many(new_translations, from_lang, to_lang)
+
+        # Extract and return the translated text
+        translated_text = "".join(translations[piece] if translate else piece for piece, translate in pieces)
+        
+        return {
+            'original_text': text,
+            'translated_text': translated_text,
+            'from_language': from_lang,
+            'to_language': to_lang,
+            'full_response': result
+        }
+    
+    except requests.exceptions.HTTPError as http_err:
+        st.error(f"HTTP error occurred: {http_err}")
+        return {"error": str(http_err)}
+    except Exception as err:
+        st.error(f"An error occurred: {err}")
+        return {"error": str(err)}
+
+st.title("Document Translator")
+
+st.write("Upload a document (PDF or plain text) to translate its content into Hindi.")
+
+# File uploader accepts PDFs and plain text files.
+uploaded_file = st.file_uploader("Choose a file", type=["pdf", "txt"])
+
+# Allow user to enter the target language code; default is now "hi" for Hindi.
+target_language = st.text_input("Enter target language code (default is 'hi' for Hindi)", "hi")
+
+if uploaded_file is not None:
+    file_extension = uploaded_file.name.split(".")[-1].lower()
+    page_ranges = []
+    
+    if file_extension == "pdf":
+        # Pages are read with PyMuPDF in worker processes, a range at a time, and each range is
+        # translated as soon as it is ready while the following ranges are still being read
+        page_ranges = iter_page_texts(uploaded_file.read())
+    elif file_extension == "txt":
+        try:
+            page_ranges = [[uploaded_file.read().decode("utf-8")]]
+        except Exception as e:
+            st.error("Error reading text file: " + str(e))
+    
+    extracted_container = None
+    try:
+        for page_texts in page_ranges:
+            extracted_text = "".join(text + "\n" for text in page_texts if text)
+            if not extracted_text:
+                continue
+            if extracted_container is None:
+                st.subheader("Extracted Text:")
+                extracted_container = st.container()
+                st.info("Translating text into Hindi...")
+                st.subheader("Translated Text:")
+                translated_container = st.container()
+            extracted_container.write(extracted_text)
+            
+            translation_result = translate_text(extracted_text, from_lang="en", to_lang=target_language)
+            
+            if "error" in translation_result:
+                st.error("Translation failed: " + translation_result["error"])
+                break
+            translated_container.write(translation_result["translated_text"])
+    except Exception as e:
+        st.error("Error reading PDF file: " + str(e))
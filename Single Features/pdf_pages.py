@@ -0,0 +1,46 @@
+import fitz  # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+# MuPDF is not thread-safe, so pages are read in worker processes, each with its own copy of the document
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_EXTRACT_PAGES_PER_TASK = int(os.getenv("PDF_EXTRACT_PAGES_PER_TASK", "16"))
+
+_pdf_doc = None
+
+def _open_document(file_bytes):
+    global _pdf_doc
+    _pdf_doc = fitz.open(stream=file_bytes, filetype="pdf")
+
+def _extract_range(start, stop):
+    return [_pdf_doc[page_index].get_text() for page_index in range(start, stop)]
+
+def iter_page_texts(file_bytes, workers=PDF_EXTRACT_WORKERS, pages_per_task=PDF_EXTRACT_PAGES_PER_TASK):
+    """
+    Yields the text of each page, in page order, one range of pages_per_task pages at a time.
+    Ranges are extracted in parallel and each one is yielded as soon as it and the ranges before
+    it are done, so the caller can start working on the first pages while the rest are read.
+    """
+    with fitz.open(stream=file_bytes, filetype="pdf") as pdf_doc:
+        page_count = pdf_doc.page_count
+        ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+        if workers <= 1 or len(ranges) <= 1:
+            for start, stop in ranges:
+                yield [pdf_doc[page_index].get_text() for page_index in range(start, stop)]
+            return
+
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(ranges)),
+        initializer=_open_document,
+        initargs=(file_bytes,),
+    )
+    try:
+        futures = [executor.submit(_extract_range, start, stop) for start, stop in ranges]
+        for future in futures:
+            yield future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def extract_text(file_bytes, workers=PDF_EXTRACT_WORKERS):
+    # The whole document as one string, joined once; empty pages are skipped
+    return "".join(text + "\n" for page_texts in iter_page_texts(file_bytes, workers) for text in page_texts if text)
@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from document_pipeline import ANALYSIS_CONCURRENCY, COMBINED_ANALYSIS, OPTIONAL_STAGES, DocumentProcessor, analyze_document
+
+FILE_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+
+# One DocumentProcessor per worker process (or one shared by the threads of a thread pool)
+_processor = None
+
+def _init_worker():
+    # A thread pool runs this once per thread; they all keep the first processor
+    global _processor
+    if _processor is None:
+        _processor = DocumentProcessor()
+
+def find_documents(inputs):
+    paths = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*")
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in FILE_TYPES:
+                paths.append(os.path.abspath(path))
+    return sorted(set(paths))
+
+def load_completed(output_path):
+    # Records are appended one line at a time, so after a crash the file holds every finished
+    # document plus at most one truncated line, which is skipped
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                completed.add((record["path"], record["sha256"]))
+    return completed
+
+def terminate_partial_line(output_path):
+    # A crash mid-write leaves a line without its newline; close it off so the next record starts clean
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def build_record(path, sha256, analysis):
+    return {
+        "path": path,
+        "sha256": sha256,
+        "status": "ok",
+        "overall_summary": analysis["overall_summary"],
+        "section_summary": analysis["section_summary"],
+        "classification": analysis["classification"],
+        "keywords": analysis["keywords"],
+        "citations_references": analysis["citations_references"],
+        "tables": [
+            {"summary": summary, "data": json.loads(df.to_json(orient="split"))}
+            for summary, df in zip(analysis["table_summaries"], analysis["table_dataframes"])
+        ],
+        "images": [name for name, _ in analysis["images"] or []],
+        "sections": list(analysis["sections"]),
+        "errors": analysis["errors"],
+        "timings": {name: round(seconds, 4) for name, seconds in analysis["timings"].items()},
+        "critical_path": analysis["critical_path"],
+        "usage": analysis["trace"].token_usage(),
+        "spans": analysis["trace"].to_dict()["spans"],
+    }
+
+def build_error_record(path, sha256, error, start):
+    return {
+        "path": path,
+        "sha256": sha256,
+        "status": "error",
+        "error": str(error),
+        "timings": {"total": round(time.perf_counter() - start, 4)},
+    }
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def process_file(path, sha256, max_workers, combined, disabled_stages):
+    start = time.perf_counter()
+    try:
+        file_type = FILE_TYPES[os.path.splitext(path)[1].lower()]
+        analysis = analyze_document(_processor, read_file(path), file_type, max_workers, combined,
+                                    disabled_stages=disabled_stages)
+        return build_record(path, sha256, analysis)
+    except Exception as e:
+        return build_error_record(path, sha256, e, start)
+
+async def process_files_async(pending, args, write_record):
+    # Every document is a task on one event loop, args.workers of them analyzed at a time
+    from document_pipeline_aio import AsyncDocumentProcessor, analyze_document as analyze_document_async
+
+    semaphore = asyncio.Semaphore(args.workers)
+
+    async def process(processor, path, sha256):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                file_type = FILE_TYPES[os.path.splitext(path)[1].lower()]
+                file_bytes = await asyncio.to_thread(read_file, path)
+                analysis = await analyze_document_async(processor, file_bytes, file_type, args.stage_workers,
+                                                        args.combined, disabled_stages=args.skip)
+                return build_record(path, sha256, analysis)
+            except Exception as e:
+                return build_error_record(path, sha256, e, start)
+
+    async with AsyncDocumentProcessor() as processor:
+        tasks = [process(processor, path, sha256) for path, sha256 in pending]
+        for done, task in enumerate(asyncio.as_completed(tasks), 1):
+            write_record(done, await task)
+
+def write_record(output, record, done, total):
+    output.write(json.dumps(record) + "\n")
+    output.flush()
+    os.fsync(output.fileno())
+    print(f"[{done}/{total}] {record['status']} {record['path']}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the document analysis pipeline over a batch of files.")
+    parser.add_argument("inputs", nargs="+", help="Directories or glob patterns of PDF/PNG/JPG files")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file to append one record per document to")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Documents processed at the same time")
+    parser.add_argument("--executor", choices=["process", "thread", "asyncio"], default="process")
+    parser.add_argument("--stage-workers", type=int, default=ANALYSIS_CONCURRENCY, help="OpenAI calls in flight per document")
+    parser.add_argument("--combined", action="store_true", default=COMBINED_ANALYSIS, help="Use the single structured-output analysis call")
+    parser.add_argument("--no-images", action="store_true", help="Skip image extraction and captioning")
+    parser.add_argument("--skip", nargs="+", default=[], choices=OPTIONAL_STAGES, metavar="STAGE",
+                        help=f"Stages to switch off: {', '.join(OPTIONAL_STAGES)}")
+    args = parser.parse_args(argv)
+    if args.no_images and "images" not in args.skip:
+        args.skip.append("images")
+
+    paths = find_documents(args.inputs)
+    completed = load_completed(args.output)
+    terminate_partial_line(args.output)
+    pending = []
+    for path in paths:
+        sha256 = file_sha256(path)
+        if (path, sha256) not in completed:
+            pending.append((path, sha256))
+    print(f"{len(paths)} documents found, {len(paths) - len(pending)} already done, {len(pending)} to process", file=sys.stderr)
+
+    statuses = []
+    with open(args.output, "a", encoding="utf-8") as output:
+        def record_done(done, record):
+            write_record(output, record, done, len(pending))
+            statuses.append(record["status"])
+
+        if args.executor == "asyncio":
+            asyncio.run(process_files_async(pending, args, record_done))
+        else:
+            executor_class = ProcessPoolExecutor if args.executor == "process" else ThreadPoolExecutor
+            with executor_class(max_workers=args.workers, initializer=_init_worker) as executor:
+                futures = [
+                    executor.submit(process_file, path, sha256, args.stage_workers, args.combined, args.skip)
+                    for path, sha256 in pending
+                ]
+                for done, future in enumerate(as_completed(futures), 1):
+                    record_done(done, future.result())
+    return 1 if any(status != "ok" for status in statuses) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
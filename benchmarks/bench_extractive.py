@@ -0,0 +1,138 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from common import TEST_DATA, percentile, print_table, time_call
+from stubs import DEFAULT_LATENCY, start_stub_server
+
+import fitz
+from document_pipeline import DocumentProcessor, Sections, WORD_PATTERN, find_section_spans, local_extractive_summary, split_sentences
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "extractive_summaries.json")
+
+def load_sections(paths):
+    # Sections of each PDF's own text layer, so recording needs only the Language service
+    for path in paths:
+        with fitz.open(path) as pdf_doc:
+            text = "\n".join(page.get_text() for page in pdf_doc)
+        for heading, section_text in Sections(text, find_section_spans(text)).items():
+            yield os.path.basename(path), heading, section_text
+
+def record(processor, paths, max_sentences):
+    # One remote call per section, as the per-section loop used to make them
+    items = []
+    for source, heading, text in load_sections(paths):
+        start = time.perf_counter()
+        summary = processor.generate_extractive_summary(text, max_sentences, mode="remote")
+        items.append({
+            "source": source,
+            "heading": heading,
+            "text": text,
+            "remote_summary": summary,
+            "remote_seconds": time.perf_counter() - start,
+        })
+        print(f"recorded {source} / {heading} in {items[-1]['remote_seconds']:.2f}s", file=sys.stderr)
+    return {"max_sentences": max_sentences, "items": items}
+
+def stub_processor():
+    # A processor whose Language client talks to the local stand-in, which answers with each
+    # document's first sentences after its modelled latency instead of the service's ranking
+    from azure.ai.textanalytics import TextAnalyticsClient
+    from azure.core.credentials import AzureKeyCredential
+
+    base_url, process = start_stub_server({"language": DEFAULT_LATENCY["language"]})
+    processor = DocumentProcessor()
+    processor.language_client = TextAnalyticsClient(endpoint=base_url, credential=AzureKeyCredential("stub"))
+    return processor, process
+
+def normalize(sentence):
+    return " ".join(sentence.split())
+
+def sentence_overlap(local, remote):
+    # Share of the service's sentences the local summarizer also picked
+    remote_sentences = {normalize(sentence) for sentence in split_sentences(remote)}
+    if not remote_sentences:
+        return 1.0
+    local_sentences = {normalize(sentence) for sentence in split_sentences(local)}
+    return len(local_sentences & remote_sentences) / len(remote_sentences)
+
+def word_f1(local, remote):
+    local_words = set(WORD_PATTERN.findall(local.lower()))
+    remote_words = set(WORD_PATTERN.findall(remote.lower()))
+    if not local_words or not remote_words:
+        return float(local_words == remote_words)
+    common = len(local_words & remote_words)
+    return 2 * common / (len(local_words) + len(remote_words))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the local extractive summarizer with recorded Language service summaries.")
+    parser.add_argument("--record", action="store_true", help="Call the Language service and (re)write the fixture")
+    parser.add_argument("--offline", action="store_true",
+                        help="Record the remote side from the local stand-in instead of reading the fixture")
+    parser.add_argument("--inputs", nargs="+", default=sorted(glob.glob(os.path.join(TEST_DATA, "*.pdf"))))
+    parser.add_argument("--max-sentences", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.record:
+        fixture = record(DocumentProcessor(), args.inputs, args.max_sentences)
+        os.makedirs(os.path.dirname(FIXTURE), exist_ok=True)
+        with open(FIXTURE, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, indent=1)
+        print(f"{len(fixture['items'])} sections written to {FIXTURE}", file=sys.stderr)
+        return 0
+    if args.offline:
+        processor, process = stub_processor()
+        try:
+            fixture = record(processor, args.inputs, args.max_sentences)
+        finally:
+            process.terminate()
+        print("Remote summaries and latency come from the local stand-in (lead sentences, modelled latency), "
+              "not the Language service; overlap measures agreement with a lead baseline.\n")
+    elif not os.path.exists(FIXTURE):
+        print(f"No fixture at {FIXTURE}; run with --record and Azure Language credentials set first, "
+              "or with --offline to compare against the local stand-in.", file=sys.stderr)
+        return 1
+    else:
+        with open(FIXTURE, encoding="utf-8") as f:
+            fixture = json.load(f)
+
+    # The first call imports numpy; keep that out of the first section's timing
+    local_extractive_summary("One. Two. Three. Four.", 1)
+    rows = []
+    local_times = []
+    remote_times = []
+    overlaps = []
+    f1_scores = []
+    for item in fixture["items"]:
+        local_time, local_summary = time_call(local_extractive_summary, item["text"], fixture["max_sentences"], repeat=args.repeat)
+        overlap = sentence_overlap(local_summary, item["remote_summary"])
+        f1 = word_f1(local_summary, item["remote_summary"])
+        local_times.append(local_time)
+        remote_times.append(item["remote_seconds"])
+        overlaps.append(overlap)
+        f1_scores.append(f1)
+        rows.append([
+            item["source"],
+            item["heading"][:40],
+            len(item["text"]),
+            f"{item['remote_seconds'] * 1000:.0f}",
+            f"{local_time * 1000:.2f}",
+            f"{overlap:.2f}",
+            f"{f1:.2f}",
+        ])
+    print_table(["source", "section", "chars", "remote ms", "local ms", "sentence overlap", "word F1"], rows)
+    print()
+    print_table(["", "p50 ms", "p95 ms"], [
+        ["remote", f"{percentile(remote_times, 50) * 1000:.0f}", f"{percentile(remote_times, 95) * 1000:.0f}"],
+        ["local", f"{percentile(local_times, 50) * 1000:.2f}", f"{percentile(local_times, 95) * 1000:.2f}"],
+    ])
+    if overlaps:
+        print(f"\nmean sentence overlap {sum(overlaps) / len(overlaps):.2f}, mean word F1 {sum(f1_scores) / len(f1_scores):.2f} over {len(overlaps)} sections")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
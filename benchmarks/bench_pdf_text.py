@@ -0,0 +1,72 @@
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+from common import ROOT, TEST_DATA, make_synthetic_pdf, print_table, time_call
+
+# Translation.py and its page extractor live with the standalone feature scripts
+sys.path.insert(0, os.path.join(ROOT, "Single Features"))
+from pdf_pages import PDF_EXTRACT_WORKERS, extract_text, iter_page_texts
+
+try:
+    import PyPDF2
+except ImportError:
+    PyPDF2 = None
+
+def legacy_extract(file_bytes):
+    # Translation.py before the PyMuPDF extractor
+    extracted_text = ""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
+    for page in pdf_reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            extracted_text += page_text + "\n"
+    return extracted_text
+
+def first_range_seconds(file_bytes, workers):
+    # How long the translator waits before it can start on the first pages
+    start = time.perf_counter()
+    pages = iter_page_texts(file_bytes, workers)
+    next(pages)
+    elapsed = time.perf_counter() - start
+    pages.close()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PDF text extraction for the translator.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--workers", type=int, default=PDF_EXTRACT_WORKERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    if PyPDF2 is None:
+        print("PyPDF2 is not installed; the legacy column is skipped.", file=sys.stderr)
+
+    inputs = [(os.path.basename(path), open(path, "rb").read()) for path in sorted(glob.glob(os.path.join(TEST_DATA, "*.pdf")))]
+    inputs += [(f"synthetic-{pages}p", make_synthetic_pdf(pages, images_per_page=0)) for pages in args.pages]
+
+    rows = []
+    for name, file_bytes in inputs:
+        serial_time, _ = time_call(extract_text, file_bytes, 1, repeat=args.repeat)
+        parallel_time, _ = time_call(extract_text, file_bytes, args.workers, repeat=args.repeat)
+        first_time = min(first_range_seconds(file_bytes, args.workers) for _ in range(args.repeat))
+        legacy = "n/a"
+        speedup = "n/a"
+        if PyPDF2 is not None:
+            legacy_time, _ = time_call(legacy_extract, file_bytes, repeat=args.repeat)
+            legacy = f"{legacy_time * 1000:.1f}"
+            speedup = f"{legacy_time / min(serial_time, parallel_time):.1f}x"
+        rows.append([
+            name,
+            legacy,
+            f"{serial_time * 1000:.1f}",
+            f"{parallel_time * 1000:.1f}",
+            f"{first_time * 1000:.1f}",
+            speedup,
+        ])
+    print_table(["input", "PyPDF2 ms", "PyMuPDF ms", f"PyMuPDF x{args.workers} ms", "first range ms", "speedup"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import ROOT, TEST_DATA, make_synthetic_pdf, percentile, print_table
+from stubs import DEFAULT_LATENCY, start_stub_server, stub_environment
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "pipeline.json")
+DOCUMENTS = [os.path.join(TEST_DATA, "My_resume.pdf"), os.path.join(TEST_DATA, "output1.pdf")]
+
+def parse_latency(values, scale):
+    latency = dict(DEFAULT_LATENCY)
+    for value in values:
+        name, _, seconds = value.partition("=")
+        if name not in latency:
+            raise SystemExit(f"Unknown service {name!r}; expected one of {', '.join(latency)}")
+        latency[name] = float(seconds)
+    return {name: seconds * scale for name, seconds in latency.items()}
+
+def load_translator():
+    # Translation.py is a Streamlit script; imported outside `streamlit run` its UI calls are no-ops
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    path = os.path.join(ROOT, "Single Features", "Translation.py")
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location("translation_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_once(pipeline, processor, file_bytes, args, translator, cache_dir):
+    # One cold run: fresh layout and caption caches unless --warm, timings in seconds per stage
+    if not args.warm:
+        run_dir = tempfile.mkdtemp(dir=cache_dir)
+        processor.layout_cache = pipeline.LayoutCache(run_dir, pipeline.LAYOUT_CACHE_MAX_BYTES)
+        processor.caption_cache = pipeline.CaptionCache(os.path.join(run_dir, "captions.sqlite"), pipeline.CAPTION_CACHE_MAX_ENTRIES, pipeline.CAPTION_CACHE_MAX_DISTANCE)
+    first_content = []
+    start = time.perf_counter()
+    on_update = (lambda name, value: first_content or first_content.append(time.perf_counter() - start)) if args.stream else None
+    if args.use_async:
+        analysis = args.loop.run_until_complete(args.aio.analyze_document(
+            processor, file_bytes, "application/pdf", args.stage_workers, args.combined, True, on_update, args.skip
+        ))
+    else:
+        analysis = pipeline.analyze_document(processor, file_bytes, "application/pdf", args.stage_workers, args.combined, True,
+                                             on_update, args.skip)
+    timings = dict(analysis["timings"])
+    if first_content:
+        timings["first_content"] = first_content[0]
+    if args.extractive:
+        stage_start = time.perf_counter()
+        summaries = processor.generate_extractive_summaries(dict(analysis["sections"]), mode="remote")
+        if args.use_async:
+            args.loop.run_until_complete(summaries)
+        timings["extractive"] = time.perf_counter() - stage_start
+    if translator is not None:
+        if not args.warm:
+            cache = translator.get_translation_cache()
+            with cache.lock, cache.connection:
+                cache.connection.execute("DELETE FROM translations")
+        stage_start = time.perf_counter()
+        translator.translate_text(analysis["extracted_text"], from_lang="en", to_lang="hi")
+        timings["translation"] = time.perf_counter() - stage_start
+    return timings, analysis["errors"], analysis["critical_path"]
+
+def summarize(samples):
+    stages = {}
+    for timings in samples:
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {stage: {"p50": percentile(values, 50), "p95": percentile(values, 95)} for stage, values in stages.items()}
+
+def compare(results, baseline, tolerance):
+    # Rows of p50 changes against the baseline; a document's total slower than tolerance is a regression
+    rows = []
+    regressions = 0
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        for stage, current in result["stages"].items():
+            if stage not in previous["stages"]:
+                continue
+            before = previous["stages"][stage]["p50"]
+            change = (current["p50"] - before) / before if before else 0.0
+            regressed = stage == "total" and change > tolerance
+            regressions += regressed
+            rows.append([name, stage, f"{before * 1000:.1f}", f"{current['p50'] * 1000:.1f}", f"{change:+.0%}", "REGRESSION" if regressed else ""])
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the document pipeline against local stand-ins for the Azure services.")
+    parser.add_argument("--documents", nargs="+", default=DOCUMENTS)
+    parser.add_argument("--synthetic-pages", type=int, nargs="*", default=[50, 200], help="Generated PDFs of these page counts")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency", nargs="*", default=[], metavar="SERVICE=SECONDS", help=f"Injected latency per service: {', '.join(DEFAULT_LATENCY)}")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every injected latency (0 measures local work only)")
+    parser.add_argument("--stage-workers", type=int, default=None, help="OpenAI calls in flight per document (default ANALYSIS_CONCURRENCY)")
+    parser.add_argument("--combined", action="store_true", help="Use the single structured-output analysis call")
+    parser.add_argument("--stream", action="store_true", help="Stream completions and report time to first content")
+    parser.add_argument("--warm", action="store_true", help="Keep the layout and caption caches between iterations")
+    parser.add_argument("--extractive", action="store_true", help="Also summarize every section with the Language service")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the asyncio pipeline of document_pipeline_aio")
+    parser.add_argument("--skip", nargs="+", default=[], metavar="STAGE", help="Optional stages to switch off, e.g. images tables")
+    parser.add_argument("--translate", action="store_true", help="Also translate the extracted text with Translation.py")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=BASELINE, metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown of a document's total before --compare fails")
+    args = parser.parse_args()
+
+    latency = parse_latency(args.latency, args.latency_scale)
+    base_url, server = start_stub_server(latency)
+    cache_dir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    # The pipeline reads its settings when imported, so the stand-ins and caches are set up first
+    os.environ.update(stub_environment(base_url))
+    os.environ["LAYOUT_CACHE_DIR"] = os.path.join(cache_dir, "layout")
+    os.environ["CAPTION_CACHE_PATH"] = os.path.join(cache_dir, "captions.sqlite")
+    os.environ["TRANSLATION_CACHE_PATH"] = os.path.join(cache_dir, "translations.sqlite")
+    import document_pipeline as pipeline
+
+    if args.stage_workers is None:
+        args.stage_workers = pipeline.ANALYSIS_CONCURRENCY
+    translator = load_translator() if args.translate else None
+    if args.use_async:
+        # One event loop for every run, so the HTTP session stays warm as the threaded session does
+        import document_pipeline_aio
+        args.aio = document_pipeline_aio
+        args.loop = asyncio.new_event_loop()
+        processor = document_pipeline_aio.AsyncDocumentProcessor()
+    else:
+        processor = pipeline.DocumentProcessor()
+
+    inputs = [(os.path.basename(path), open(path, "rb").read()) for path in args.documents]
+    inputs += [(f"synthetic-{pages}p", make_synthetic_pdf(pages, images_per_page=2)) for pages in args.synthetic_pages]
+
+    results = {}
+    rows = []
+    critical_paths = []
+    try:
+        for name, file_bytes in inputs:
+            samples = []
+            errors = []
+            paths = {}
+            for _ in range(args.iterations):
+                timings, run_errors, path = run_once(pipeline, processor, file_bytes, args, translator, cache_dir)
+                samples.append(timings)
+                errors.extend(run_errors)
+                paths[" → ".join(path)] = paths.get(" → ".join(path), 0) + 1
+            # Memory is measured on a separate run, as tracing slows every allocation down.
+            # tracemalloc sees Python allocations only, not MuPDF's own buffers.
+            tracemalloc.start()
+            run_once(pipeline, processor, file_bytes, args, translator, cache_dir)
+            peak_mib = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+            stages = summarize(samples)
+            critical_path = max(paths, key=paths.get)
+            results[name] = {"stages": stages, "peak_mib": peak_mib, "errors": len(errors), "critical_path": critical_path}
+            for stage, values in sorted(stages.items(), key=lambda item: (item[0] == "total", -item[1]["p50"])):
+                rows.append([name, stage, f"{values['p50'] * 1000:.1f}", f"{values['p95'] * 1000:.1f}", ""])
+            rows.append([name, "peak memory", "", "", f"{peak_mib:.1f} MiB"])
+            critical_paths.append(f"{name}: {critical_path}")
+            if errors:
+                print(f"{name}: {len(errors)} stage errors, first: {errors[0]}", file=sys.stderr)
+    finally:
+        if args.use_async:
+            args.loop.run_until_complete(processor.close())
+            args.loop.close()
+        server.terminate()
+
+    print(f"{args.iterations} iterations per document, injected latency: "
+          + ", ".join(f"{name}={seconds:g}s" for name, seconds in latency.items()))
+    print_table(["document", "stage", "p50 ms", "p95 ms", "memory"], rows)
+    print("\ncritical path (most frequent):")
+    for line in critical_paths:
+        print(f"  {line}")
+    if resource is not None:
+        print(f"\nmax RSS of the benchmark process: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        comparison, regressions = compare(results, baseline, args.tolerance)
+        print(f"\nagainst {args.compare}:")
+        print_table(["document", "stage", "baseline p50 ms", "p50 ms", "change", ""], comparison)
+        status = 1 if regressions else 0
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        settings = {"iterations": args.iterations, "latency": latency, "stage_workers": args.stage_workers,
+                    "combined": args.combined, "stream": args.stream, "warm": args.warm, "async": args.use_async, "skip": args.skip}
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=1)
+        print(f"\nbaseline saved to {args.save_baseline}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+import argparse
+import glob
+import io
+import os
+
+from common import TEST_DATA, make_synthetic_pdf, print_table, time_call
+
+import fitz
+from document_pipeline import normalize_pdf
+
+def legacy_preprocess(file_bytes):
+    # preprocess_pdf before the single-pass normalizer, plus the second parse the image stage did
+    pdf_doc = fitz.open(stream=file_bytes, filetype="pdf")
+    new_pdf = fitz.open()
+    for page in pdf_doc:
+        new_pdf.insert_pdf(pdf_doc, from_page=page.number, to_page=page.number)
+    output_stream = io.BytesIO()
+    new_pdf.save(output_stream)
+    output = output_stream.getvalue()
+    fitz.open(stream=output, filetype="pdf")
+    return output
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the PDF preprocessing paths.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    inputs = [(os.path.basename(path), open(path, "rb").read()) for path in sorted(glob.glob(os.path.join(TEST_DATA, "*.pdf")))]
+    inputs += [(f"synthetic-{pages}p", make_synthetic_pdf(pages, images_per_page=2)) for pages in args.pages]
+
+    rows = []
+    for name, file_bytes in inputs:
+        legacy_time, legacy_bytes = time_call(legacy_preprocess, file_bytes, repeat=args.repeat)
+        fast_time, (fast_bytes, _) = time_call(normalize_pdf, file_bytes, False, repeat=args.repeat)
+        compressed_time, (compressed_bytes, _) = time_call(normalize_pdf, file_bytes, True, repeat=args.repeat)
+        rows.append([
+            name,
+            f"{len(file_bytes) / 1024:.0f}",
+            f"{legacy_time * 1000:.1f} / {len(legacy_bytes) / 1024:.0f}",
+            f"{fast_time * 1000:.1f} / {len(fast_bytes) / 1024:.0f}",
+            f"{compressed_time * 1000:.1f} / {len(compressed_bytes) / 1024:.0f}",
+            f"{legacy_time / fast_time:.1f}x",
+        ])
+    print_table(["input", "KiB in", "legacy ms / KiB", "normalize ms / KiB", "compress ms / KiB", "speedup"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import random
+
+from common import print_table, time_call
+
+from azure.ai.formrecognizer import AnalyzeResult
+from document_pipeline import SECTION_HEADING_PATTERN, Sections, find_section_spans, get_result_text
+
+def legacy_segment(text):
+    # DocumentProcessor.segment_sections before the span segmenter: a regex and a stripped copy per line
+    sections = {}
+    lines = text.split("\n")
+    current_section = "General"
+    sections[current_section] = []
+    for line in lines:
+        if SECTION_HEADING_PATTERN.match(line):
+            current_section = line.strip().rstrip(":")
+            sections[current_section] = []
+        else:
+            sections[current_section].append(line.strip())
+    return {section: " ".join(content).strip() for section, content in sections.items() if content}
+
+def make_result(lines, section_every=40):
+    # An AnalyzeResult-shaped layout with a sectionHeading paragraph every section_every lines
+    rng = random.Random(lines)
+    page_lines = []
+    paragraphs = []
+    offset = 0
+    for index in range(lines):
+        if index % section_every == 0:
+            content = f"{index // section_every + 1}. Section {rng.choice(['Results', 'Methods', 'Discussion'])}"
+            paragraphs.append({"role": "sectionHeading", "content": content, "spans": [{"offset": offset, "length": len(content)}]})
+        else:
+            content = f"Line {index}: quarterly revenue grew {rng.randint(1, 99)}% while costs stayed flat."
+        page_lines.append({"content": content, "polygon": [], "spans": [{"offset": offset, "length": len(content)}]})
+        offset += len(content) + 1
+    pages = [{"page_number": number + 1, "lines": page_lines[start:start + 50], "spans": []}
+             for number, start in enumerate(range(0, lines, 50))]
+    content = "\n".join(line["content"] for line in page_lines)
+    return AnalyzeResult.from_dict({"model_id": "prebuilt-layout", "content": content, "pages": pages, "paragraphs": paragraphs, "tables": []})
+
+def segment_and_read(text, result=None):
+    sections = Sections(text, find_section_spans(text, result))
+    for heading in sections:
+        sections[heading]
+    return sections
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare section segmentation on large extracted texts.")
+    parser.add_argument("--lines", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for lines in args.lines:
+        result = make_result(lines)
+        text = get_result_text(result)
+        legacy_time, legacy_sections = time_call(legacy_segment, text, repeat=args.repeat)
+        spans_time, sections = time_call(lambda: Sections(text, find_section_spans(text)), repeat=args.repeat)
+        layout_time, _ = time_call(lambda: Sections(text, find_section_spans(text, result)), repeat=args.repeat)
+        read_time, _ = time_call(segment_and_read, text, repeat=args.repeat)
+        rows.append([
+            f"{lines:,}",
+            f"{len(text) / 1024 / 1024:.1f}",
+            f"{legacy_time * 1000:.1f} / {len(legacy_sections)}",
+            f"{spans_time * 1000:.1f} / {len(sections)}",
+            f"{layout_time * 1000:.1f}",
+            f"{read_time * 1000:.1f}",
+            f"{legacy_time / spans_time:.1f}x",
+        ])
+    # The legacy segmenter keeps only the last section of each repeated heading, hence its lower count
+    print_table(["lines", "MiB", "legacy ms / sections", "spans ms / sections", "layout spans ms", "spans + read all ms", "speedup"], rows)
+
+if __name__ == "__main__":
+    main()
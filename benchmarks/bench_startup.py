@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from common import ROOT, percentile, print_table
+from stubs import stub_environment
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "startup.json")
+
+# Each probe runs in a fresh interpreter, so nothing is cached in sys.modules, and prints its
+# timings in seconds as JSON
+PROBES = {
+    "import document_pipeline": """
+import json, time
+start = time.perf_counter()
+import document_pipeline
+print(json.dumps({"seconds": time.perf_counter() - start}))
+""",
+    # The Streamlit app's first run with nothing uploaded (title, sidebar and uploader), then a
+    # rerun in the same process as a widget change would trigger
+    "first paint": """
+import json, logging, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+app = AppTest.from_file("final_Project.py", default_timeout=120)
+app.run()
+first_paint = time.perf_counter() - start
+rerun_start = time.perf_counter()
+app.run()
+assert not app.exception, app.exception
+print(json.dumps({"seconds": first_paint, "rerun": time.perf_counter() - rerun_start}))
+""",
+    # What the first document pays for the modules its stages import on first use
+    "stage imports": """
+import json, time
+import document_pipeline
+start = time.perf_counter()
+import numpy, pandas, fitz, PIL.Image, requests
+import azure.ai.formrecognizer, azure.ai.textanalytics, azure.cognitiveservices.vision.computervision, msrest.authentication
+print(json.dumps({"seconds": time.perf_counter() - start}))
+""",
+}
+
+def run_probe(code):
+    # Endpoints of the local stand-ins, which are never started: nothing here calls a service
+    env = {**os.environ, **stub_environment("http://127.0.0.1:9")}
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def import_breakdown(module, top):
+    # Direct imports of module by cumulative time, from -X importtime (microseconds on stderr).
+    # The report is post-order: a module's imports are listed just before it.
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative_us), name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                break
+            children = []
+    return sorted(children, reverse=True)[:top]
+
+def compare(results, baseline, tolerance):
+    rows = []
+    regressions = 0
+    for name, current in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        before = previous["p50"]
+        change = (current["p50"] - before) / before if before else 0.0
+        regressed = change > tolerance
+        regressions += regressed
+        rows.append([name, f"{before * 1000:.0f}", f"{current['p50'] * 1000:.0f}", f"{change:+.0%}", "REGRESSION" if regressed else ""])
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the pipeline import and the Streamlit app's first paint in fresh interpreters.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest direct imports of document_pipeline to list")
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=BASELINE, metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before --compare fails")
+    args = parser.parse_args()
+
+    samples = {}
+    for _ in range(args.repeat):
+        for name, code in PROBES.items():
+            timings = run_probe(code)
+            samples.setdefault(name, []).append(timings["seconds"])
+            if "rerun" in timings:
+                samples.setdefault("rerun", []).append(timings["rerun"])
+    results = {name: {"p50": percentile(values, 50), "min": min(values)} for name, values in samples.items()}
+
+    print(f"{args.repeat} fresh interpreters per probe")
+    print_table(["probe", "p50 ms", "min ms"], [[name, f"{value['p50'] * 1000:.0f}", f"{value['min'] * 1000:.0f}"] for name, value in results.items()])
+    print("\nslowest direct imports of document_pipeline:")
+    print_table(["module", "cumulative ms"], [[name, f"{us / 1000:.1f}"] for us, name in import_breakdown("document_pipeline", args.top)])
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        comparison, regressions = compare(results, baseline, args.tolerance)
+        print(f"\nagainst {args.compare}:")
+        print_table(["probe", "baseline p50 ms", "p50 ms", "change", ""], comparison)
+        status = 1 if regressions else 0
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": {"repeat": args.repeat}, "results": results}, f, indent=1)
+        print(f"\nbaseline saved to {args.save_baseline}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import argparse
+from types import SimpleNamespace
+
+from common import print_table, time_call
+
+import pandas as pd
+from document_pipeline import convert_table_to_dataframe
+
+def legacy_convert(table):
+    # convert_table_to_dataframe before the grid rewrite: one df.iloc write per cell
+    max_row = max(cell.row_index for cell in table.cells) if table.cells else 0
+    max_col = max(cell.column_index for cell in table.cells) if table.cells else 0
+    df = pd.DataFrame(index=range(max_row+1), columns=range(max_col+1))
+    for cell in table.cells:
+        df.iloc[cell.row_index, cell.column_index] = cell.content
+    if any(cell.kind == "columnHeader" for cell in table.cells):
+        df.columns = df.iloc[0]
+        df = df[1:]
+    return df
+
+def make_table(rows, columns):
+    # Stand-in for a Form Recognizer DocumentTable: a header row, then text and number columns
+    cells = []
+    for row in range(rows):
+        for column in range(columns):
+            content = f"Column {column}" if row == 0 else (f"{row * column:,}" if column % 2 else f"item {row}")
+            cells.append(SimpleNamespace(
+                row_index=row,
+                column_index=column,
+                row_span=1,
+                column_span=1,
+                kind="columnHeader" if row == 0 else "content",
+                content=content,
+            ))
+    return SimpleNamespace(cells=cells)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare table-to-DataFrame conversion.")
+    parser.add_argument("--sizes", nargs="+", default=["10x5", "100x10", "1000x20"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        n_rows, n_columns = (int(part) for part in size.split("x"))
+        table = make_table(n_rows, n_columns)
+        legacy_time, legacy_df = time_call(legacy_convert, table, repeat=args.repeat)
+        grid_time, grid_df = time_call(convert_table_to_dataframe, table, False, repeat=args.repeat)
+        numeric_time, _ = time_call(convert_table_to_dataframe, table, True, repeat=args.repeat)
+        identical = legacy_df.equals(grid_df) and legacy_df.columns.equals(grid_df.columns)
+        rows.append([
+            size,
+            f"{legacy_time * 1000:.1f}",
+            f"{grid_time * 1000:.2f}",
+            f"{numeric_time * 1000:.2f}",
+            f"{legacy_time / grid_time:.0f}x",
+            "yes" if identical else "NO",
+        ])
+    print_table(["table", "legacy ms", "grid ms", "grid+numeric ms", "speedup", "same output"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DATA = os.path.join(ROOT, "test_data")
+
+# Benchmarks import the pipeline modules from the repository root
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def time_call(fn, *args, repeat=5):
+    # Returns (median seconds, last result)
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), result
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def make_synthetic_pdf(pages, images_per_page=1, lines_per_page=40):
+    # Text-heavy pages with a repeated logo and distinct images per page, like a scanned report
+    import random
+
+    import fitz
+
+    rng = random.Random(pages)
+    doc = fitz.open()
+    logo = fitz.Pixmap(fitz.csRGB, 120, 60, bytes((x * 2 + y) % 256 for y in range(60) for x in range(120) for _ in range(3)), False)
+    logo_png = logo.tobytes("png")
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"{page_number + 1}. Section {page_number + 1}:", fontsize=14)
+        for line in range(lines_per_page):
+            page.insert_text(
+                (72, 90 + line * 16),
+                f"Line {line + 1} of page {page_number + 1}: quarterly revenue grew while costs stayed flat.",
+                fontsize=9,
+            )
+        if images_per_page:
+            page.insert_image(fitz.Rect(440, 20, 560, 80), stream=logo_png)
+        for image in range(images_per_page - 1):
+            pixmap = fitz.Pixmap(fitz.csRGB, 200, 150, rng.randbytes(200 * 150 * 3), False)
+            top = 120 + image * 160
+            page.insert_image(fitz.Rect(300, top, 560, top + 150), stream=pixmap.tobytes("png"))
+    return doc.tobytes()
+
+def print_table(header, rows):
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header, ["-" * width for width in widths]] + rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)))
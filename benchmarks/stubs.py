@@ -0,0 +1,292 @@
+import io
+import json
+import multiprocessing
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import common  # Puts the repository root on sys.path for document_pipeline
+
+# Seconds each stand-in waits before answering; override per service with --latency
+DEFAULT_LATENCY = {
+    "form_recognizer": 0.8,
+    "language": 0.4,
+    "vision": 0.3,
+    "openai": 1.2,
+    "translator": 0.2,
+    # Delay the long-running-operation pollers of Form Recognizer and Language wait before polling
+    "poll_interval": 0.0,
+}
+
+STUB_ANSWER = (
+    "This document describes the applicant's experience and skills. "
+    "It lists projects, tools and responsibilities in reverse chronological order. "
+    "Key terms include Azure, Python, document processing and data analysis."
+)
+
+def _camel(name):
+    head, *rest = name.split("_")
+    return head + "".join(part.capitalize() for part in rest)
+
+def to_rest(node):
+    # AnalyzeResult.to_dict() shape (snake_case, polygons as points) to the REST wire shape
+    if isinstance(node, dict):
+        converted = {}
+        for key, value in node.items():
+            if value is None:
+                continue
+            if key == "polygon":
+                converted[key] = [coordinate for point in value for coordinate in (point["x"], point["y"])]
+            else:
+                converted[_camel(key)] = to_rest(value)
+        return converted
+    if isinstance(node, list):
+        return [to_rest(item) for item in node]
+    return node
+
+def build_layout(document):
+    # A Form Recognizer answer built from the document's own text layer, plus one small table so
+    # the table stages run; images get a single line of text
+    import fitz
+    from document_pipeline import build_local_layout
+
+    try:
+        pdf_doc = fitz.open(stream=document, filetype="pdf")
+    except Exception:
+        pdf_doc = None
+    if pdf_doc is not None and pdf_doc.page_count:
+        layout = build_local_layout(pdf_doc, range(pdf_doc.page_count))
+    else:
+        text = "Scanned image text"
+        polygon = [{"x": 0, "y": 0}, {"x": 1, "y": 0}, {"x": 1, "y": 1}, {"x": 0, "y": 1}]
+        layout = {
+            "model_id": "prebuilt-layout",
+            "content": text,
+            "pages": [{"page_number": 1, "angle": 0, "width": 8.5, "height": 11, "unit": "inch",
+                       "lines": [{"content": text, "polygon": polygon, "spans": [{"offset": 0, "length": len(text)}]}],
+                       "spans": [{"offset": 0, "length": len(text)}]}],
+            "paragraphs": [],
+            "tables": [],
+        }
+    cells = []
+    for row, values in enumerate([("Quarter", "Revenue", "Cost"), ("Q1", "1,200", "800"), ("Q2", "1,450", "820")]):
+        for column, value in enumerate(values):
+            cells.append({
+                "kind": "columnHeader" if row == 0 else "content",
+                "row_index": row,
+                "column_index": column,
+                "row_span": 1,
+                "column_span": 1,
+                "content": value,
+                "bounding_regions": [],
+                "spans": [],
+            })
+    layout["tables"] = [{"row_count": 3, "column_count": 3, "cells": cells, "bounding_regions": [{"page_number": 1, "polygon": []}], "spans": []}]
+    result = to_rest(layout)
+    result.update({"apiVersion": "2023-07-31", "stringIndexType": "unicodeCodePoint"})
+    return result
+
+def split_sentences(text):
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text) if sentence.strip()]
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _wait(self, service):
+        time.sleep(self.server.latency.get(service, 0.0))
+
+    def _poll_headers(self, location):
+        # azure-core treats Retry-After: 0 as missing and falls back to a one-second poll interval
+        delay_ms = max(1, int(self.server.latency.get("poll_interval", 0.0) * 1000))
+        return {"Operation-Location": location, "retry-after-ms": str(delay_ms)}
+
+    def _base_url(self):
+        return f"http://{self.headers['Host']}"
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._body()
+        if ":analyze" in url.path:
+            self._wait("form_recognizer")
+            operation_id = uuid.uuid4().hex
+            self.server.operations[operation_id] = {
+                "status": "succeeded",
+                "createdDateTime": "2024-01-01T00:00:00Z",
+                "lastUpdatedDateTime": "2024-01-01T00:00:00Z",
+                "analyzeResult": build_layout(body),
+            }
+            model_path = url.path.split(":analyze")[0]
+            location = f"{self._base_url()}{model_path}/analyzeResults/{operation_id}?{url.query}"
+            self._send_json(202, {}, self._poll_headers(location))
+        elif url.path.endswith("/analyze-text/jobs"):
+            self._wait("language")
+            request = json.loads(body)
+            documents = []
+            for document in request["analysisInput"]["documents"]:
+                sentences = []
+                offset = 0
+                for sentence in split_sentences(document["text"])[:3]:
+                    offset = document["text"].find(sentence, offset)
+                    sentences.append({"text": sentence, "rankScore": 0.5, "offset": offset, "length": len(sentence)})
+                documents.append({"id": document["id"], "sentences": sentences, "warnings": []})
+            operation_id = uuid.uuid4().hex
+            self.server.operations[operation_id] = {
+                "jobId": operation_id,
+                "status": "succeeded",
+                "createdDateTime": "2024-01-01T00:00:00Z",
+                "lastUpdatedDateTime": "2024-01-01T00:00:00Z",
+                "expirationDateTime": "2024-01-02T00:00:00Z",
+                "tasks": {"completed": 1, "failed": 0, "inProgress": 0, "total": 1, "items": [{
+                    "kind": "ExtractiveSummarizationLROResults",
+                    "taskName": "0",
+                    "lastUpdateDateTime": "2024-01-01T00:00:00Z",
+                    "status": "succeeded",
+                    "results": {"documents": documents, "errors": [], "modelVersion": "2023-04-01"},
+                }]},
+            }
+            location = f"{self._base_url()}{url.path}/{operation_id}?{url.query}"
+            self._send_json(202, {}, self._poll_headers(location))
+        elif url.path.endswith("/analyze") and "/vision/" in url.path:
+            self._wait("vision")
+            from PIL import Image
+            try:
+                width, height = Image.open(io.BytesIO(body)).size
+            except Exception:
+                width, height = 0, 0
+            self._send_json(200, {
+                "description": {"tags": ["text"], "captions": [{"text": "a chart with text", "confidence": 0.9}]},
+                "requestId": uuid.uuid4().hex,
+                "metadata": {"width": width, "height": height, "format": "Jpeg"},
+                "modelVersion": "2021-05-01",
+            })
+        elif url.path.endswith("/chat/completions"):
+            self._chat_completion(json.loads(body))
+        elif url.path.endswith("/translate"):
+            self._wait("translator")
+            to_lang = parse_qs(url.query).get("to", ["hi"])[0]
+            self._send_json(200, [
+                {"translations": [{"text": f"[{to_lang}] {element['text']}", "to": to_lang}]}
+                for element in json.loads(body)
+            ])
+        else:
+            self._send_json(404, {"error": {"code": "NotFound", "message": url.path}})
+
+    def do_GET(self):
+        operation_id = urlparse(self.path).path.rstrip("/").rsplit("/", 1)[-1]
+        operation = self.server.operations.pop(operation_id, None)
+        if operation is None:
+            self._send_json(404, {"error": {"code": "NotFound", "message": self.path}})
+        else:
+            self._send_json(200, operation)
+
+    def _chat_completion(self, request):
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            properties = response_format["json_schema"]["schema"]["properties"]
+            content = json.dumps({name: STUB_ANSWER for name in properties})
+        else:
+            content = STUB_ANSWER
+        prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                 "total_tokens": prompt_tokens + len(content) // 4}
+        latency = self.server.latency.get("openai", 0.0)
+        if not request.get("stream"):
+            time.sleep(latency)
+            self._send_json(200, {
+                "id": uuid.uuid4().hex,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+            return
+        # Half the latency before the first token, the rest spread over the stream
+        words = content.split(" ")
+        time.sleep(latency / 2)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, word in enumerate(words):
+            delta = word if index == 0 else f" {word}"
+            self._send_chunk(f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': delta}}]})}\n\n")
+            time.sleep(latency / 2 / len(words))
+        # Like the service, usage is only sent when the request asks for it
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._send_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+        self._send_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections at exit are not worth a traceback
+        pass
+
+def _serve(latency, ready):
+    # Imported before serving so the first analyze request does not pay for it
+    import document_pipeline
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    server.latency = latency
+    server.operations = {}
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+def start_stub_server(latency=None):
+    # Runs the stand-ins in their own process so they stay out of the benchmark's timings and
+    # memory; returns the base URL and the process to terminate when done
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=({**DEFAULT_LATENCY, **(latency or {})}, ready), daemon=True)
+    process.start()
+    port = ready.get(timeout=30)
+    return f"http://127.0.0.1:{port}", process
+
+def stub_environment(base_url):
+    # Settings that point every client in the pipeline at the stand-ins
+    return {
+        "AZURE_FORM_RECOGNIZER_ENDPOINT": base_url,
+        "AZURE_FORM_RECOGNIZER_KEY": "stub",
+        "AZURE_LANGUAGE_ENDPOINT": base_url,
+        "AZURE_LANGUAGE_KEY": "stub",
+        "AZURE_COMPUTER_VISION_ENDPOINT": base_url,
+        "AZURE_COMPUTER_VISION_KEY": "stub",
+        "AZURE_OPENAI_ENDPOINT": base_url,
+        "AZURE_OPENAI_KEY": "stub",
+        "OPENAI_DEPLOYMENT": "stub",
+        "AZURE_TRANSLATOR_ENDPOINT": f"{base_url}/translator/text/v3.0/translate",
+        "AZURE_TRANSLATOR_KEY": "stub",
+    }
+
+if __name__ == "__main__":
+    base_url, process = start_stub_server()
+    print(f"Stub services listening on {base_url}; Ctrl+C to stop")
+    for name, value in stub_environment(base_url).items():
+        print(f"{name}={value}")
+    try:
+        process.join()
+    except KeyboardInterrupt:
+        process.terminate()
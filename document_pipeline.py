@@ -0,0 +1,1807 @@
+from dotenv import load_dotenv
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import re
+import io
+import gzip
+import json
+import hashlib
+import sqlite3
+import threading
+import bisect
+from collections.abc import Mapping
+import random
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DOC_INTEL_ENDPOINT = os.getenv("AZURE_FORM_RECOGNIZER_ENDPOINT")
+DOC_INTEL_KEY = os.getenv("AZURE_FORM_RECOGNIZER_KEY")
+OPENAI_ENDPOINT = (os.getenv("AZURE_OPENAI_ENDPOINT") or "").rstrip('/')
+OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
+OPENAI_DEPLOYMENT = os.getenv("OPENAI_DEPLOYMENT")
+OPENAI_API_VERSION = "2024-02-15-preview"
+# json_schema response_format needs a newer API version than the plain chat calls
+OPENAI_STRUCTURED_API_VERSION = os.getenv("OPENAI_STRUCTURED_API_VERSION", "2024-08-01-preview")
+AZURE_LANGUAGE_ENDPOINT = os.getenv("AZURE_LANGUAGE_ENDPOINT")
+AZURE_LANGUAGE_KEY = os.getenv("AZURE_LANGUAGE_KEY")
+AZURE_COMPUTER_VISION_ENDPOINT = os.getenv("AZURE_COMPUTER_VISION_ENDPOINT")
+AZURE_COMPUTER_VISION_KEY = os.getenv("AZURE_COMPUTER_VISION_KEY")
+# Upper bound on OpenAI calls in flight per document; 1 runs the stages back-to-back
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "8"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+OPENAI_BACKOFF_BASE = 1.0
+OPENAI_BACKOFF_CAP = 60.0
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Long documents are summarized chunk by chunk; ~4 characters per token is close enough for budgeting
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "6000"))
+CHARS_PER_TOKEN = 4
+COMBINED_ANALYSIS = os.getenv("COMBINED_ANALYSIS", "false").lower() in ("1", "true", "yes")
+LAYOUT_CACHE_DIR = os.getenv("LAYOUT_CACHE_DIR", ".layout_cache")
+LAYOUT_CACHE_MAX_BYTES = int(os.getenv("LAYOUT_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Computer Vision captioning: parallel calls per document, and a per-process cap on calls per second
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "4"))
+VISION_RATE_LIMIT = float(os.getenv("VISION_RATE_LIMIT", "10"))
+# Born-digital PDF pages are read from their own text layer and only pages that need OCR
+# (or contain tables, when LOCAL_TEXT_TABLES is on) are sent to Form Recognizer
+LOCAL_TEXT_FAST_PATH = os.getenv("LOCAL_TEXT_FAST_PATH", "false").lower() in ("1", "true", "yes")
+LOCAL_TEXT_TABLES = os.getenv("LOCAL_TEXT_TABLES", "true").lower() in ("1", "true", "yes")
+LOCAL_TEXT_MIN_CHARS = int(os.getenv("LOCAL_TEXT_MIN_CHARS", "50"))
+LOCAL_TEXT_MIN_GLYPH_COVERAGE = 0.02
+# Images are shrunk to VISION_MAX_SIDE pixels on the longest side and re-encoded as JPEG before
+# captioning; originals already within the limit and under VISION_REUSE_MAX_BYTES go up untouched
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1024"))
+# Computer Vision rejects images with a side shorter than this, so they are neither captioned
+# nor shrunk below it
+VISION_MIN_SIDE = 50
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+VISION_REUSE_MAX_BYTES = int(os.getenv("VISION_REUSE_MAX_KB", "256")) * 1024
+# Images are kept for display as thumbnails no larger than this
+THUMBNAIL_MAX_SIDE = int(os.getenv("THUMBNAIL_MAX_SIDE", "512"))
+# Formats the Computer Vision 3.2 analyze API accepts as-is
+VISION_FORMATS = {"JPEG", "PNG", "GIF", "BMP"}
+# Captions are reused across documents for images whose 64-bit dHash differs in at most
+# CAPTION_CACHE_MAX_DISTANCE bits from one captioned before
+CAPTION_CACHE_PATH = os.getenv("CAPTION_CACHE_PATH", ".caption_cache.sqlite")
+CAPTION_CACHE_MAX_ENTRIES = int(os.getenv("CAPTION_CACHE_MAX_ENTRIES", "5000"))
+CAPTION_CACHE_MAX_DISTANCE = int(os.getenv("CAPTION_CACHE_MAX_DISTANCE", "4"))
+# Convert all-numeric table columns (thousands separators allowed) from text to numbers
+TABLE_INFER_NUMERIC = os.getenv("TABLE_INFER_NUMERIC", "false").lower() in ("1", "true", "yes")
+# garbage-collect and deflate PDFs before upload to shrink the payload
+PDF_COMPRESS = os.getenv("PDF_COMPRESS", "false").lower() in ("1", "true", "yes")
+# PDFs longer than OCR_SHARD_PAGES are sent to Form Recognizer as page ranges in parallel; 0 disables sharding
+OCR_SHARD_PAGES = int(os.getenv("OCR_SHARD_PAGES", "0"))
+OCR_SHARD_CONCURRENCY = int(os.getenv("OCR_SHARD_CONCURRENCY", "4"))
+# Extractive summaries: "remote" uses the Language service, "local" the in-process summarizer, and
+# "auto" keeps texts under EXTRACTIVE_LOCAL_MAX_CHARS, or with no more sentences than asked for, local
+EXTRACTIVE_SUMMARY_MODE = os.getenv("EXTRACTIVE_SUMMARY_MODE", "auto")
+EXTRACTIVE_LOCAL_MAX_CHARS = int(os.getenv("EXTRACTIVE_LOCAL_MAX_CHARS", "2000"))
+# The Language service accepts at most 25 documents and 125,000 characters per extractive
+# summarization request; a longer text is sent as several documents
+EXTRACTIVE_BATCH_SIZE = 25
+EXTRACTIVE_MAX_REQUEST_CHARS = 125000
+EXTRACTIVE_CONCURRENCY = int(os.getenv("EXTRACTIVE_CONCURRENCY", "4"))
+# Streamed completions ask for a usage chunk at the end, which needs API version 2024-09-01-preview
+# or later; they use this version when the call's own is older
+OPENAI_STREAM_API_VERSION = os.getenv("OPENAI_STREAM_API_VERSION", "2024-10-21")
+# A streaming stage hands its text so far to on_update at most this often (seconds)
+STREAM_UPDATE_INTERVAL = float(os.getenv("STREAM_UPDATE_INTERVAL", "0.1"))
+# Process-wide span and token totals are written here after each document: Prometheus text
+# format, or JSON when the path ends in .json. Empty disables the export.
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH", "")
+
+SECTION_HEADING_PATTERN = re.compile(r"^\s*([A-Z][A-Za-z\s-]+:|\d+\.\s+[A-Z][A-Za-z\s-]+)")
+# The same test for every line after the first, run over a whole text at once. Starting with the
+# newline lets the regex engine jump between line starts instead of trying every position.
+# Whitespace is \s without the newline, so a heading never runs into the next line; inside the
+# heading's character class that is spelled out (every \s character is below U+3001).
+_LINE_SPACE = re.escape("".join(char for char in map(chr, range(0x3001)) if char.isspace() and char != "\n"))
+SECTION_HEADING_LINE_PATTERN = re.compile(
+    rf"\n[^\S\n]*(?:[A-Z][A-Za-z{_LINE_SPACE}-]+:|\d+\.[^\S\n]+[A-Z][A-Za-z{_LINE_SPACE}-]+).*"
+)
+SECTION_HEADING_ROLES = ("title", "sectionHeading")
+_NON_SPACE = re.compile(r"\S")
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n\s*\n")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Errors from the current document's stages are collected here for the caller to show;
+# run_stages copies the context into its worker threads so the sink follows the work
+_error_sink = contextvars.ContextVar("error_sink", default=None)
+
+# Set by a stage whose output is shown while it is generated: generate_openai_response then
+# streams the completion and passes each new piece of text to this callback
+_token_sink = contextvars.ContextVar("token_sink", default=None)
+
+# Timing spans of the current document, and the span a new one is nested in; like the error
+# sink they follow the work into run_stages' threads
+_trace_sink = contextvars.ContextVar("trace_sink", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Bounds the current document's OpenAI calls in flight, however many stages are running
+_openai_slots = contextvars.ContextVar("openai_slots", default=None)
+
+# MuPDF is not thread-safe, and OCR and image extraction of one document now overlap, so
+# every PyMuPDF pass over a document holds this lock
+PDF_LOCK = threading.Lock()
+
+def report_error(message):
+    logger.error(message)
+    errors = _error_sink.get()
+    if errors is not None:
+        errors.append(message)
+
+class Trace:
+    # Spans of one document, with start and end in seconds since the trace began
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def token_usage(self):
+        # estimated is set when some calls reported no usage and were counted from text length
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        estimated = False
+        with self._lock:
+            for span in self.spans:
+                for key in usage:
+                    usage[key] += span.get(key, 0)
+                estimated = estimated or bool(span.get("usage_estimated"))
+        return {**usage, "estimated": estimated}
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return {"spans": spans, "usage": self.token_usage()}
+
+class Metrics:
+    # Totals across every document this process has handled, for scraping or export
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.span_count = {}
+        self.span_seconds = {}
+        self.span_failures = {}
+        self.tokens = {"prompt": 0, "completion": 0, "estimated_prompt": 0, "estimated_completion": 0}
+
+    def observe(self, name, kind, seconds, failed, usage):
+        key = (name, kind)
+        with self._lock:
+            self.span_count[key] = self.span_count.get(key, 0) + 1
+            self.span_seconds[key] = self.span_seconds.get(key, 0.0) + seconds
+            self.span_failures[key] = self.span_failures.get(key, 0) + failed
+            prefix = "estimated_" if usage.get("usage_estimated") else ""
+            self.tokens[f"{prefix}prompt"] += usage.get("prompt_tokens", 0)
+            self.tokens[f"{prefix}completion"] += usage.get("completion_tokens", 0)
+
+    def to_json(self):
+        with self._lock:
+            return {
+                "spans": [
+                    {"name": name, "kind": kind, "count": count, "seconds": self.span_seconds[(name, kind)],
+                     "failures": self.span_failures[(name, kind)]}
+                    for (name, kind), count in sorted(self.span_count.items())
+                ],
+                "openai_tokens": dict(self.tokens),
+            }
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP doc_pipeline_span_seconds Time spent in pipeline stages and external calls.",
+            "# TYPE doc_pipeline_span_seconds summary",
+        ]
+        data = self.to_json()
+        for span in data["spans"]:
+            labels = f'name="{span["name"]}",kind="{span["kind"]}"'
+            lines.append(f"doc_pipeline_span_seconds_sum{{{labels}}} {span['seconds']:.6f}")
+            lines.append(f"doc_pipeline_span_seconds_count{{{labels}}} {span['count']}")
+        lines += ["# HELP doc_pipeline_span_failures_total Spans that ended with an exception.",
+                  "# TYPE doc_pipeline_span_failures_total counter"]
+        for span in data["spans"]:
+            lines.append(f'doc_pipeline_span_failures_total{{name="{span["name"]}",kind="{span["kind"]}"}} {span["failures"]}')
+        lines += ["# HELP doc_pipeline_openai_tokens_total Tokens reported in Azure OpenAI usage (estimated_*: counted from text length).",
+                  "# TYPE doc_pipeline_openai_tokens_total counter"]
+        for kind, count in data["openai_tokens"].items():
+            lines.append(f'doc_pipeline_openai_tokens_total{{type="{kind}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        content = json.dumps(self.to_json(), indent=1) if path.endswith(".json") else self.to_prometheus()
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+metrics = Metrics()
+
+def export_metrics(path=METRICS_EXPORT_PATH):
+    if not path:
+        return
+    try:
+        metrics.export(path)
+    except OSError as e:
+        logger.warning("Could not export metrics to %s: %s", path, e)
+
+@contextlib.contextmanager
+def span(name, kind="call", **attributes):
+    # Times the block into the current trace and the process metrics. The block may add to the
+    # yielded attributes; prompt_tokens and completion_tokens are also counted as token usage.
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield attributes
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        end = time.perf_counter()
+        _current_span.reset(token)
+        metrics.observe(name, kind, end - start, failed, attributes)
+        trace = _trace_sink.get()
+        if trace is not None:
+            trace.add({
+                "name": name,
+                "kind": kind,
+                "parent": parent,
+                "start": start - trace.origin,
+                "end": end - trace.origin,
+                "thread": threading.current_thread().name,
+                "failed": failed,
+                **attributes,
+            })
+
+class RateLimiter:
+    # Spaces calls at least 1/rate seconds apart across all threads; a rate of 0 means unlimited
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Claims the next call slot and returns how long to wait for it
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        return max(0.0, delay)
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+VISION_RATE_LIMITER = RateLimiter(VISION_RATE_LIMIT)
+
+class VisionUploadStats:
+    def __init__(self):
+        self.images = 0
+        self.original_bytes = 0
+        self.uploaded_bytes = 0
+        self.encode_seconds = 0.0
+        self.caption_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, original_bytes, uploaded_bytes, encode_seconds, caption_seconds):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original_bytes
+            self.uploaded_bytes += uploaded_bytes
+            self.encode_seconds += encode_seconds
+            self.caption_seconds += caption_seconds
+
+    def stats(self):
+        with self._lock:
+            images = self.images or 1
+            return {
+                "images": self.images,
+                "original_bytes": self.original_bytes,
+                "uploaded_bytes": self.uploaded_bytes,
+                "avg_encode_ms": 1000 * self.encode_seconds / images,
+                "avg_caption_ms": 1000 * self.caption_seconds / images,
+            }
+
+vision_upload_stats = VisionUploadStats()
+
+class LayoutCache:
+    # Form Recognizer results on disk, keyed by model id + SHA-256 of the submitted bytes.
+    # Entries are gzipped AnalyzeResult dicts; file mtime is the LRU clock. Every PDF rewrite
+    # before submission passes no_new_id=True, so the same upload always gives the same key.
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, document, model_id):
+        digest = hashlib.sha256(document).hexdigest()
+        return os.path.join(self.directory, f"{model_id}-{digest}.json.gz")
+
+    def get(self, document, model_id):
+        from azure.ai.formrecognizer import AnalyzeResult
+
+        path = self._path(document, model_id)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return AnalyzeResult.from_dict(data)
+
+    def put(self, document, model_id, result):
+        path = self._path(document, model_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(result.to_dict(), f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json.gz"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    total -= size
+                except OSError:
+                    pass
+
+    def analyze(self, client, document, model_id="prebuilt-layout"):
+        result = self.get(document, model_id)
+        if result is None:
+            with span("begin_analyze_document", model_id=model_id, bytes=len(document)):
+                result = client.begin_analyze_document(model_id=model_id, document=document).result()
+            self.put(document, model_id, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+@functools.lru_cache(maxsize=None)
+def get_layout_cache():
+    return LayoutCache(LAYOUT_CACHE_DIR, LAYOUT_CACHE_MAX_BYTES)
+
+def dhash(image_data):
+    # Difference hash: one bit per horizontally adjacent pixel pair of a 9x8 grayscale thumbnail.
+    # Flat images all hash to 0 whatever their colour, so they get None and are never cached.
+    import numpy as np
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_data))
+    image.draft("L", (64, 64))
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    if pixels.max() - pixels.min() < 8:
+        return None
+    return int(np.packbits(pixels[:, 1:] > pixels[:, :-1]).view(">u8")[0])
+
+class CaptionCache:
+    # Computer Vision results keyed by perceptual hash and kept in SQLite, so logos, stamps and
+    # signatures seen in earlier documents skip the network. Lookup takes the nearest stored
+    # hash by Hamming distance; past max_entries the least recently used tenth is dropped.
+    # Each caption is one row, and processes sharing the file (batch.py --executor process)
+    # see each other's captions: the in-memory hash index is reloaded whenever another
+    # connection has committed since the last lookup.
+    def __init__(self, path, max_entries, max_distance):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS captions (hash TEXT PRIMARY KEY, analysis TEXT, used REAL)")
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._keys = []
+        self._known = set()
+        # The hash array is built by the next lookup, so opening the cache needs no numpy
+        self._hashes = None
+
+    def _refresh(self):
+        version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._keys = [int(key, 16) for key, in self.connection.execute("SELECT hash FROM captions")]
+            self._known = set(self._keys)
+            self._hashes = None
+
+    def get(self, hash_value):
+        import numpy as np
+        from azure.cognitiveservices.vision.computervision.models import ImageAnalysis
+
+        with self._lock:
+            self._refresh()
+            if self._keys:
+                if self._hashes is None:
+                    self._hashes = np.array(self._keys, dtype=np.uint64)
+                distances = np.bitwise_count(self._hashes ^ np.uint64(hash_value))
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= self.max_distance:
+                    key = f"{self._keys[nearest]:016x}"
+                    with self.connection:
+                        row = self.connection.execute("SELECT analysis FROM captions WHERE hash = ?", (key,)).fetchone()
+                        self.connection.execute("UPDATE captions SET used = ? WHERE hash = ?", (time.time(), key))
+                    # None when another process evicted it since the index was loaded
+                    if row is not None:
+                        self.hits += 1
+                        return ImageAnalysis.deserialize(json.loads(row[0]))
+            self.misses += 1
+            return None
+
+    def put(self, hash_value, analysis_result):
+        data = json.dumps(analysis_result.serialize())
+        with self._lock:
+            self._refresh()
+            evict = hash_value not in self._known and len(self._keys) >= self.max_entries
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO captions VALUES (?, ?, ?)", (f"{hash_value:016x}", data, time.time())
+                )
+                if evict:
+                    self.connection.execute(
+                        "DELETE FROM captions WHERE hash IN (SELECT hash FROM captions ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                        (max(1, self.max_entries * 9 // 10),),
+                    )
+            if evict:
+                self._data_version = None
+            elif hash_value not in self._known:
+                self._keys.append(hash_value)
+                self._known.add(hash_value)
+                self._hashes = None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": self.connection.execute("SELECT COUNT(*) FROM captions").fetchone()[0],
+            }
+
+@functools.lru_cache(maxsize=None)
+def get_caption_cache():
+    return CaptionCache(CAPTION_CACHE_PATH, CAPTION_CACHE_MAX_ENTRIES, CAPTION_CACHE_MAX_DISTANCE)
+
+def get_result_text(result):
+    return "\n".join([line.content for page in result.pages for line in page.lines])
+
+def find_heading_lines(text, result):
+    # Start offset in text of each line inside a title or sectionHeading paragraph, mapped to
+    # that paragraph's index, for text built from result by get_result_text
+    heading_spans = [
+        (span.offset, span.offset + span.length)
+        for paragraph in result.paragraphs or []
+        if paragraph.role in SECTION_HEADING_ROLES
+        for span in paragraph.spans
+    ]
+    if not heading_spans:
+        return {}
+    line_starts = {}
+    offset = 0
+    for page in result.pages:
+        for line in page.lines:
+            if line.spans:
+                line_starts[line.spans[0].offset] = offset
+            offset += len(line.content) + 1
+    content_offsets = sorted(line_starts)
+    heading_lines = {}
+    for index, (start, end) in enumerate(sorted(heading_spans)):
+        position = bisect.bisect_left(content_offsets, start)
+        while position < len(content_offsets) and content_offsets[position] < end:
+            heading_lines[line_starts[content_offsets[position]]] = index
+            position += 1
+    return heading_lines
+
+def find_section_spans(text, result=None):
+    # One pass that yields (heading, start, end) for every section, with start:end indexing the
+    # section body in text. Given the layout result that text came from (get_result_text),
+    # lines inside a title or sectionHeading paragraph also start a section, and a heading
+    # wrapped over several lines stays one heading. Bodies may be empty and headings may repeat.
+    first_line_end = text.find("\n")
+    if first_line_end < 0:
+        first_line_end = len(text)
+    heading_starts = [match.start() + 1 for match in SECTION_HEADING_LINE_PATTERN.finditer(text, first_line_end)]
+    if SECTION_HEADING_PATTERN.match(text, 0, first_line_end):
+        heading_starts.insert(0, 0)
+    heading_lines = find_heading_lines(text, result) if result is not None else {}
+    if heading_lines:
+        heading_starts = sorted(set(heading_starts).union(heading_lines))
+
+    heading = "General"
+    body_start = 0
+    last_paragraph = None
+    for line_start in heading_starts:
+        line_end = text.find("\n", line_start)
+        if line_end < 0:
+            line_end = len(text)
+        line = text[line_start:line_end].strip()
+        paragraph = heading_lines.get(line_start)
+        if paragraph is not None and paragraph == last_paragraph and body_start == line_start:
+            heading = f"{heading} {line}".rstrip(":")
+        else:
+            yield heading, body_start, max(body_start, line_start - 1)
+            heading = line.rstrip(":")
+        last_paragraph = paragraph
+        body_start = line_end + 1
+    yield heading, min(body_start, len(text)), len(text)
+
+class Sections(Mapping):
+    # heading -> section text, read-only. Only offsets are kept; a section's text is built the
+    # first time it is read. A heading seen again becomes "Heading (2)", "Heading (3)", ...
+    def __init__(self, text, spans):
+        self.text = text
+        self.spans = {}
+        seen = {}
+        for heading, start, end in spans:
+            if not _NON_SPACE.search(text, start, end):
+                continue
+            seen[heading] = seen.get(heading, 0) + 1
+            key = heading if seen[heading] == 1 else f"{heading} ({seen[heading]})"
+            while key in self.spans:
+                seen[heading] += 1
+                key = f"{heading} ({seen[heading]})"
+            self.spans[key] = (start, end)
+        self._texts = {}
+
+    def __getitem__(self, heading):
+        if heading not in self._texts:
+            start, end = self.spans[heading]
+            self._texts[heading] = " ".join(line.strip() for line in self.text[start:end].split("\n")).strip()
+        return self._texts[heading]
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def __len__(self):
+        return len(self.spans)
+
+def split_sentences(text):
+    return [sentence for sentence in (part.strip() for part in SENTENCE_BOUNDARY_PATTERN.split(text)) if sentence]
+
+def local_extractive_summary(text, max_sentences=3):
+    # TF-IDF centrality: each sentence is scored by its cosine similarity to the sum of all the
+    # others, with the sentence-term matrix kept as (row, column, weight) arrays so the cost is
+    # linear in the number of words. The best sentences are returned in document order.
+    import numpy as np
+
+    sentences = split_sentences(text)
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
+    vocabulary = {}
+    rows = []
+    columns = []
+    for index, sentence in enumerate(sentences):
+        for word in WORD_PATTERN.findall(sentence.lower()):
+            rows.append(index)
+            columns.append(vocabulary.setdefault(word, len(vocabulary)))
+    if not vocabulary:
+        return " ".join(sentences[:max_sentences])
+    n_sentences = len(sentences)
+    n_terms = len(vocabulary)
+    cells, counts = np.unique(np.array(rows, dtype=np.int64) * n_terms + np.array(columns), return_counts=True)
+    rows, columns = np.divmod(cells, n_terms)
+    idf = np.log((1 + n_sentences) / (1 + np.bincount(columns, minlength=n_terms))) + 1
+    weights = (1 + np.log(counts)) * idf[columns]
+    weights /= np.sqrt(np.bincount(rows, weights ** 2, minlength=n_sentences))[rows]
+    centroid = np.bincount(columns, weights, minlength=n_terms)
+    # Every sentence has similarity 1 with itself, so it is left out of its own score
+    scores = np.bincount(rows, weights * centroid[columns], minlength=n_sentences) - (np.bincount(rows, minlength=n_sentences) > 0)
+    best = np.sort(np.argsort(-scores, kind="stable")[:max_sentences])
+    return " ".join(sentences[index] for index in best)
+
+def summarize_locally(text, max_sentences=3, mode=EXTRACTIVE_SUMMARY_MODE):
+    if mode in ("local", "remote"):
+        return mode == "local"
+    return len(text) <= EXTRACTIVE_LOCAL_MAX_CHARS or len(split_sentences(text)) <= max_sentences
+
+class DocumentProcessor:
+    # Clients and caches are built on first use, each importing its SDK then, so a processor
+    # costs nothing to create and a stage that never runs never loads its SDK. The clients are
+    # thread-safe, so one processor per process can serve every session and worker thread.
+    @functools.cached_property
+    def form_recognizer_client(self):
+        from azure.ai.formrecognizer import DocumentAnalysisClient
+        from azure.core.credentials import AzureKeyCredential
+
+        return DocumentAnalysisClient(
+            endpoint=DOC_INTEL_ENDPOINT,
+            credential=AzureKeyCredential(DOC_INTEL_KEY)
+        )
+
+    @functools.cached_property
+    def language_client(self):
+        from azure.ai.textanalytics import TextAnalyticsClient
+        from azure.core.credentials import AzureKeyCredential
+
+        return TextAnalyticsClient(
+            endpoint=AZURE_LANGUAGE_ENDPOINT,
+            credential=AzureKeyCredential(AZURE_LANGUAGE_KEY)
+        )
+
+    @functools.cached_property
+    def vision_client(self):
+        from azure.cognitiveservices.vision.computervision import ComputerVisionClient
+        from msrest.authentication import CognitiveServicesCredentials
+
+        return ComputerVisionClient(
+            AZURE_COMPUTER_VISION_ENDPOINT,
+            CognitiveServicesCredentials(AZURE_COMPUTER_VISION_KEY)
+        )
+
+    @functools.cached_property
+    def layout_cache(self):
+        return get_layout_cache()
+
+    @functools.cached_property
+    def caption_cache(self):
+        return get_caption_cache()
+
+    def analyze_layout(self, document, model_id="prebuilt-layout", shard_pages=OCR_SHARD_PAGES,
+                       max_workers=OCR_SHARD_CONCURRENCY):
+        if shard_pages > 0 and document[:5] == b"%PDF-":
+            shards = split_pdf(document, shard_pages)
+            if len(shards) > 1:
+                return self.analyze_layout_shards(shards, model_id, max_workers)
+        return self.layout_cache.analyze(self.form_recognizer_client, document, model_id)
+
+    def analyze_layout_local_first(self, file_bytes, pdf_doc=None, model_id="prebuilt-layout",
+                                   check_tables=LOCAL_TEXT_TABLES):
+        from azure.ai.formrecognizer import AnalyzeResult
+
+        local, remote_pages, remote_bytes = split_local_layout(file_bytes, pdf_doc, check_tables)
+        if local is None:
+            return self.analyze_layout(file_bytes, model_id)
+        if not remote_pages:
+            return AnalyzeResult.from_dict(local)
+        remote_result = self.analyze_layout(remote_bytes, model_id)
+        return merge_local_layout(local, remote_result, remote_pages)
+
+    def analyze_layout_shards(self, shards, model_id="prebuilt-layout", max_workers=OCR_SHARD_CONCURRENCY):
+        # Each shard is cached on its own, so a rerun only re-submits the shards that changed
+        results = run_stages(
+            {i: (self.layout_cache.analyze, self.form_recognizer_client, shard, model_id)
+             for i, (_, shard) in enumerate(shards)},
+            max_workers,
+        )
+        for i in range(len(shards)):
+            if isinstance(results[i], Exception):
+                raise results[i]
+        return merge_layout_results([(first_page, results[i]) for i, (first_page, _) in enumerate(shards)])
+
+    def extract_text(self, uploaded_file):
+        result = self.analyze_layout(uploaded_file.read())
+        return result, get_result_text(result)
+
+    def segment_sections(self, text, result=None):
+        return Sections(text, find_section_spans(text, result))
+
+    def generate_extractive_summary(self, text, max_sentences=3, mode=EXTRACTIVE_SUMMARY_MODE):
+        return self.generate_extractive_summaries({"text": text}, max_sentences, mode)["text"]
+
+    def generate_extractive_summaries(self, texts, max_sentences=3, mode=EXTRACTIVE_SUMMARY_MODE):
+        # Summaries under the keys of texts, in the same order. Texts the routing policy keeps
+        # local never leave the process; the rest go to the Language service in batches within
+        # its document and character limits that run concurrently, and a text the service
+        # fails on falls back to the local summarizer.
+        summaries, remote_keys, batches = plan_extractive_summaries(texts, max_sentences, mode)
+
+        def summarize_batch(batch):
+            from azure.ai.textanalytics import ExtractiveSummaryAction
+
+            with span("begin_analyze_actions", documents=len(batch)):
+                poller = self.language_client.begin_analyze_actions(
+                    documents=batch,
+                    actions=[ExtractiveSummaryAction(max_sentence_count=max_sentences)]
+                )
+                return list(poller.result())
+
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(EXTRACTIVE_CONCURRENCY, len(batches))) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, summarize_batch, batch) for batch in batches]
+                for future in futures:
+                    add_extractive_results(summaries, future.result(), remote_keys, texts, max_sentences)
+        finish_extractive_summaries(summaries, max_sentences)
+        return {key: summaries[key] for key in texts}
+
+def plan_extractive_summaries(texts, max_sentences=3, mode=EXTRACTIVE_SUMMARY_MODE):
+    # The summaries made locally, the key of each document left for the Language service, and
+    # those documents packed into batches, with ids indexing into the keys. A text over the
+    # request limit is split at sentences into several documents under the same key.
+    summaries = {}
+    remote_keys = []
+    documents = []
+    for key, text in texts.items():
+        if summarize_locally(text, max_sentences, mode):
+            summaries[key] = local_extractive_summary(text, max_sentences)
+            continue
+        for piece in split_extractive_text(text, EXTRACTIVE_MAX_REQUEST_CHARS):
+            documents.append({"id": str(len(remote_keys)), "language": "en", "text": piece})
+            remote_keys.append(key)
+    batches = []
+    size = 0
+    for document in documents:
+        if not batches or len(batches[-1]) == EXTRACTIVE_BATCH_SIZE or size + len(document["text"]) > EXTRACTIVE_MAX_REQUEST_CHARS:
+            batches.append([])
+            size = 0
+        batches[-1].append(document)
+        size += len(document["text"])
+    return summaries, remote_keys, batches
+
+def split_extractive_text(text, limit):
+    if len(text) <= limit:
+        return [text]
+    pieces = [""]
+    for sentence in split_sentences(text):
+        # A sentence longer than the limit on its own is cut wherever the limit falls
+        for start in range(0, len(sentence), limit):
+            part = sentence[start:start + limit]
+            if pieces[-1] and len(pieces[-1]) + 1 + len(part) > limit:
+                pieces.append("")
+            pieces[-1] = f"{pieces[-1]} {part}" if pieces[-1] else part
+    return pieces
+
+def add_extractive_results(summaries, document_results, remote_keys, texts, max_sentences):
+    # Sentences are gathered per key as (document id, sentences) until every document of the
+    # text is in; a failed document makes the whole text fall back to the local summarizer
+    for result in document_results:
+        extract_summary_result = result[0]
+        key = remote_keys[int(extract_summary_result.id)]
+        if isinstance(summaries.get(key), str):
+            continue
+        if extract_summary_result.is_error:
+            report_error(f"Extractive summary of {key} failed: {extract_summary_result.error.message}")
+            summaries[key] = local_extractive_summary(texts[key], max_sentences)
+        else:
+            summaries.setdefault(key, []).append((int(extract_summary_result.id), extract_summary_result.sentences))
+
+def finish_extractive_summaries(summaries, max_sentences):
+    # A text sent as several documents keeps the best-ranked sentences across them, in text order
+    for key, pieces in summaries.items():
+        if isinstance(pieces, str):
+            continue
+        sentences = [(document_id, sentence) for document_id, piece in sorted(pieces, key=lambda item: item[0]) for sentence in piece]
+        if len(pieces) > 1:
+            best = sorted(range(len(sentences)), key=lambda index: -sentences[index][1].rank_score)[:max_sentences]
+            sentences = [sentences[index] for index in sorted(best)]
+        summaries[key] = " ".join(sentence.text for _, sentence in sentences)
+
+@functools.lru_cache(maxsize=None)
+def get_http_session():
+    # One keep-alive pool per process, shared by every session and stage thread
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, ANALYSIS_CONCURRENCY), max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_retry_after(response):
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+def get_backoff_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        return min(retry_after, OPENAI_BACKOFF_CAP)
+    # Full jitter keeps concurrent stages from retrying in lockstep
+    return random.uniform(0, min(OPENAI_BACKOFF_CAP, OPENAI_BACKOFF_BASE * 2 ** attempt))
+
+def post_with_retries(url, max_retries=OPENAI_MAX_RETRIES, timeout=None, **kwargs):
+    import requests
+
+    session = get_http_session()
+    timeout = timeout or (OPENAI_CONNECT_TIMEOUT, OPENAI_READ_TIMEOUT)
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.post(url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+            time.sleep(get_backoff_delay(attempt))
+            continue
+        if response.status_code in RETRYABLE_STATUS_CODES and attempt < max_retries:
+            response.close()
+            time.sleep(get_backoff_delay(attempt, get_retry_after(response)))
+            continue
+        response.raise_for_status()
+        return response
+
+def read_chat_stream(response, on_token, usage=None):
+    # Server-sent events: one "data: {chunk}" line per delta, terminated by "data: [DONE]".
+    # The chunk carrying token usage, sent last, is copied into usage.
+    parts = []
+    with response:
+        for line in response.iter_lines():
+            if not read_chat_event(line, parts, on_token, usage):
+                break
+    return "".join(parts)
+
+def read_chat_event(line, parts, on_token, usage=None):
+    # Appends the line's delta to parts; returns False once the stream is done
+    if not line.startswith(b"data:"):
+        return True
+    data = line[5:].strip()
+    if data == b"[DONE]":
+        return False
+    chunk = json.loads(data)
+    if chunk.get("usage") and usage is not None:
+        usage.update(chunk["usage"])
+    for choice in chunk.get("choices", []):
+        delta = (choice.get("delta") or {}).get("content")
+        if delta:
+            parts.append(delta)
+            on_token(delta)
+    return True
+
+def chat_request(prompt, max_tokens=500, response_format=None, api_version=OPENAI_API_VERSION, stream=False):
+    # URL, query parameters, headers and body of one chat completion call
+    url = f"{OPENAI_ENDPOINT}/openai/deployments/{OPENAI_DEPLOYMENT}/chat/completions"
+    if stream:
+        # The dated versions sort as strings
+        api_version = max(api_version, OPENAI_STREAM_API_VERSION)
+    params = {"api-version": api_version}
+    headers = {
+        "Content-Type": "application/json",
+        "api-key": OPENAI_KEY
+    }
+    payload = {
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": 0.7
+    }
+    if response_format:
+        payload["response_format"] = response_format
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return url, params, headers, payload
+
+def generate_openai_response(prompt, max_tokens=500, timeout=None, response_format=None, api_version=OPENAI_API_VERSION):
+    on_token = _token_sink.get()
+    try:
+        url, params, headers, payload = chat_request(prompt, max_tokens, response_format, api_version, on_token is not None)
+        with _openai_slots.get() or contextlib.nullcontext(), \
+                span("generate_openai_response", max_tokens=max_tokens, stream=on_token is not None) as attributes:
+            response = post_with_retries(url, headers=headers, params=params, json=payload, timeout=timeout,
+                                         stream=on_token is not None)
+            usage = {}
+            if on_token is not None:
+                content = read_chat_stream(response, on_token, usage)
+                usage = usage or estimate_usage(prompt, content)
+            else:
+                body = response.json()
+                usage = body.get("usage") or {}
+                content = body["choices"][0]["message"]["content"]
+            attributes.update({key: usage[key] for key in ("prompt_tokens", "completion_tokens", "total_tokens", "usage_estimated") if key in usage})
+        return content
+    except Exception as e:
+        report_error(f"OpenAI API error: {str(e)}")
+        return None
+
+# Prompt templates shared with document_pipeline_aio; the document text fills the {}
+PROMPTS = {
+    "overall_summary": "Provide an overall summary of this document in 3-5 sentences:\n\n{}",
+    "section_summary": "Provide a section-wise summary of this document, with each section summarized in 1-2 sentences:\n\n{}",
+    "classification": "Classify this document into categories and provide relevant tags:\n\n{}",
+    "keywords": "Extract and define key terms from this document in bullet points:\n\n{}",
+    "citations_references": "Extract citations, references, and links from this document:\n\n{}",
+    "table": "Summarize this table:\n{}",
+    "combined_analysis": "Analyze this document and fill in every field of the response:\n\n{}",
+    "condense": "Summarize this part of a longer document in a few sentences, keeping its section headings and key facts:\n\n{}",
+    "merge": "Merge these consecutive partial summaries of one document into a single summary, keeping section headings and key facts:\n\n{}",
+}
+
+def generate_overall_summary(text):
+    return generate_openai_response(PROMPTS["overall_summary"].format(text))
+
+def generate_section_summary(text):
+    return generate_openai_response(PROMPTS["section_summary"].format(text))
+
+def generate_summaries(text):
+    return generate_overall_summary(text), generate_section_summary(text)
+
+def classify_document(text):
+    return generate_openai_response(PROMPTS["classification"].format(text))
+
+def convert_table_to_dataframe(table, infer_numeric=TABLE_INFER_NUMERIC):
+    # Fill a preallocated object grid in one pass over the cells, copying merged cells into
+    # every position they span, then build the DataFrame in one go. Unfilled positions stay NaN.
+    import pandas as pd
+    import numpy as np
+
+    if not table.cells:
+        return pd.DataFrame(index=range(1), columns=range(1))
+    n_rows = max(cell.row_index + (cell.row_span or 1) for cell in table.cells)
+    n_cols = max(cell.column_index + (cell.column_span or 1) for cell in table.cells)
+    grid = np.full((n_rows, n_cols), np.nan, dtype=object)
+    for cell in table.cells:
+        grid[cell.row_index:cell.row_index + (cell.row_span or 1),
+             cell.column_index:cell.column_index + (cell.column_span or 1)] = cell.content
+    df = pd.DataFrame(grid)
+    if any(cell.kind == "columnHeader" for cell in table.cells):
+        df.columns = df.iloc[0]
+        df = df[1:]
+    if infer_numeric:
+        for i in range(df.shape[1]):
+            column = df.iloc[:, i]
+            numbers = pd.to_numeric(column.str.replace(",", "", regex=False).str.strip(), errors="coerce")
+            if column.notna().any() and numbers.notna().sum() == column.notna().sum():
+                df.isetitem(i, numbers)
+    return df
+
+def summarize_table(df, index):
+    summary = generate_openai_response(PROMPTS["table"].format(df.to_string()), 100)
+    return f"Table {index+1} Summary:\n{summary}"
+
+def analyze_visual_elements(result):
+    table_summaries = []
+    table_dataframes = []
+    for i, table in enumerate(result.tables[:3]):
+        try:
+            df = convert_table_to_dataframe(table)
+            table_dataframes.append(df)
+            table_summaries.append(summarize_table(df, i))
+        except Exception as e:
+            table_summaries.append(f"Error processing table {i+1}: {str(e)}")
+    return table_summaries, table_dataframes
+
+def extract_keywords(text):
+    return generate_openai_response(PROMPTS["keywords"].format(text))
+
+def extract_citations_references(text):
+    return generate_openai_response(PROMPTS["citations_references"].format(text))
+
+# Per-field stages over the whole document text, keyed by the result slot main() renders
+TEXT_STAGES = {
+    "overall_summary": generate_overall_summary,
+    "section_summary": generate_section_summary,
+    "classification": classify_document,
+    "keywords": extract_keywords,
+    "citations_references": extract_citations_references,
+}
+
+COMBINED_ANALYSIS_SCHEMA = {
+    "name": "document_analysis",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "overall_summary": {"type": "string", "description": "Overall summary of the document in 3-5 sentences."},
+            "section_summary": {"type": "string", "description": "Section-wise summary in Markdown, each section summarized in 1-2 sentences."},
+            "classification": {"type": "string", "description": "Categories the document belongs to and relevant tags, in Markdown."},
+            "keywords": {"type": "string", "description": "Key terms from the document with definitions, as Markdown bullet points."},
+            "citations_references": {"type": "string", "description": "Citations, references and links found in the document, in Markdown."},
+        },
+        "required": list(TEXT_STAGES),
+        "additionalProperties": False,
+    },
+}
+
+def parse_combined_analysis(content):
+    # Keep only the fields that came back as non-empty strings; the rest are re-requested one by one
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        field: data[field].strip()
+        for field in TEXT_STAGES
+        if isinstance(data.get(field), str) and data[field].strip()
+    }
+
+def generate_combined_analysis(text):
+    content = generate_openai_response(
+        PROMPTS["combined_analysis"].format(text),
+        max_tokens=500 * len(TEXT_STAGES),
+        response_format={"type": "json_schema", "json_schema": COMBINED_ANALYSIS_SCHEMA},
+        api_version=OPENAI_STRUCTURED_API_VERSION,
+    )
+    return parse_combined_analysis(content)
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def estimate_usage(prompt, content):
+    # Stand-in for a stream that ended without its usage chunk, labelled as an estimate
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = estimate_tokens(content) if content else 0
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens, "usage_estimated": True}
+
+def chunk_document(result, token_budget=CHUNK_TOKEN_BUDGET):
+    # Blocks never straddle a page or a section heading; blocks are packed into chunks under
+    # the budget, and only a block that is too big on its own gets split between lines
+    blocks = []
+    for page in result.pages:
+        block = []
+        for line in page.lines:
+            if block and SECTION_HEADING_PATTERN.match(line.content):
+                blocks.append(block)
+                block = []
+            block.append(line.content)
+        if block:
+            blocks.append(block)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for block in blocks:
+        block_tokens = estimate_tokens("\n".join(block))
+        if block_tokens <= token_budget:
+            if current and current_tokens + block_tokens > token_budget:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.extend(block)
+            current_tokens += block_tokens
+            continue
+        for line in block:
+            line_tokens = estimate_tokens(line)
+            if current and current_tokens + line_tokens > token_budget:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(line)
+            current_tokens += line_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def summarize_chunks(prompt_template, chunks, max_workers=ANALYSIS_CONCURRENCY, token_budget=CHUNK_TOKEN_BUDGET):
+    results = run_stages(
+        {i: (generate_openai_response, prompt_template.format(chunk)) for i, chunk in enumerate(chunks)},
+        max_workers,
+    )
+    return collect_chunk_summaries(results, chunks, token_budget)
+
+def collect_chunk_summaries(results, chunks, token_budget=CHUNK_TOKEN_BUDGET):
+    # A chunk whose summary failed or came back empty keeps its own text, cut to an even share
+    # of the budget, so the digest still covers it. With no summary at all there is nothing
+    # worth analyzing, and the stages reading the digest are skipped.
+    failed = [i for i in range(len(chunks)) if not (isinstance(results[i], str) and results[i])]
+    if len(failed) == len(chunks):
+        raise RuntimeError(f"Summarizing all {len(chunks)} chunks failed: {results[failed[0]] or 'empty response'}")
+    if failed:
+        report_error(
+            f"Summarizing {len(failed)} of {len(chunks)} chunks failed, their text is used truncated: "
+            f"{results[failed[0]] or 'empty response'}"
+        )
+    share = max(1, token_budget // len(chunks)) * CHARS_PER_TOKEN
+    return [chunks[i][:share] if i in failed else results[i] for i in range(len(chunks))]
+
+def condense_document(result, text, token_budget=CHUNK_TOKEN_BUDGET, max_workers=ANALYSIS_CONCURRENCY):
+    # Documents that fit the budget are analyzed as-is. Longer ones are summarized per chunk
+    # in parallel (map), then adjacent summaries are merged level by level (reduce) until
+    # the digest fits into a single prompt.
+    if estimate_tokens(text) <= token_budget:
+        return text
+    summaries = summarize_chunks(PROMPTS["condense"], chunk_document(result, token_budget), max_workers, token_budget)
+    while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > token_budget:
+        merged = summarize_chunks(PROMPTS["merge"], group_summaries(summaries, token_budget), max_workers, token_budget)
+        if len(merged) >= len(summaries):
+            break
+        summaries = merged
+    return "\n\n".join(summaries)
+
+def group_summaries(summaries, token_budget=CHUNK_TOKEN_BUDGET):
+    # Adjacent summaries joined into merge inputs of at least two summaries, under the budget where possible
+    groups = []
+    for summary in summaries:
+        if groups and (len(groups[-1]) < 2 or estimate_tokens("\n\n".join(groups[-1] + [summary])) <= token_budget):
+            groups[-1].append(summary)
+        else:
+            groups.append([summary])
+    return ["\n\n".join(group) for group in groups]
+
+@contextlib.contextmanager
+def stage_timer(timings, name):
+    start = time.perf_counter()
+    try:
+        with span(str(name), "stage"):
+            yield
+    finally:
+        if timings is not None:
+            timings[name] = time.perf_counter() - start
+
+def _timed(name, timings, fn, *args):
+    # Only named stages get a span; fan-outs keyed by image hash or shard index do not
+    if timings is None:
+        return fn(*args)
+    with stage_timer(timings, name):
+        return fn(*args)
+
+def stream_updates(name, on_update, interval=STREAM_UPDATE_INTERVAL):
+    # Token sink of one stage: collects the deltas and hands on_update the text so far at most
+    # once per interval, so a long answer is not re-sent and re-rendered for every token
+    parts = []
+    last_update = None
+
+    def on_token(delta):
+        nonlocal last_update
+        parts.append(delta)
+        now = time.perf_counter()
+        if last_update is None or now - last_update >= interval:
+            last_update = now
+            on_update(name, "".join(parts))
+
+    return on_token
+
+def _streamed_stage(name, on_update, fn, *args):
+    token = _token_sink.set(stream_updates(name, on_update))
+    try:
+        value = fn(*args)
+    finally:
+        _token_sink.reset(token)
+    on_update(name, value)
+    return value
+
+def run_stages(stages, max_workers=ANALYSIS_CONCURRENCY, timings=None):
+    # stages maps a result slot to (function, *args). Every stage runs to completion
+    # on its own; a failing stage leaves its exception in its slot and the rest carry on.
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {
+            executor.submit(contextvars.copy_context().run, _timed, name, timings, fn, *args): name
+            for name, (fn, *args) in stages.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+    return results
+
+def run_graph(graph, timings=None, disabled=()):
+    # graph maps a node to (dependencies, function, *args). A node is submitted as soon as all
+    # its dependencies are done and is called with args followed by their results, so every
+    # ready node runs at the same time. A failing node leaves its exception in its slot; it
+    # and disabled nodes leave their dependents unrun, with None in their slots. Returns the
+    # results and the critical path: the chain of nodes, each one the last dependency to
+    # finish before the next could start, that ends with the last node to finish.
+    check_graph(graph)
+    results = {}
+    skipped = set()
+    intervals = {}
+    waiting = dict(graph)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(graph))) as executor:
+        while waiting or running:
+            for name, (dependencies, fn, *args) in list(waiting.items()):
+                if not all(dependency in results for dependency in dependencies):
+                    continue
+                del waiting[name]
+                if name in disabled or any(dependency in skipped for dependency in dependencies):
+                    results[name] = None
+                    skipped.add(name)
+                    continue
+                args += [results[dependency] for dependency in dependencies]
+                future = executor.submit(contextvars.copy_context().run, _graph_node, name, timings, intervals, fn, *args)
+                running[future] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = e
+                    skipped.add(name)
+    return results, critical_path(graph, intervals)
+
+def check_graph(graph):
+    for name, (dependencies, *_) in graph.items():
+        missing = [dependency for dependency in dependencies if dependency not in graph]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {', '.join(missing)}")
+    ordered = set()
+    remaining = dict(graph)
+    while remaining:
+        ready = [name for name, (dependencies, *_) in remaining.items() if ordered.issuperset(dependencies)]
+        if not ready:
+            raise ValueError(f"Stages with circular dependencies: {', '.join(remaining)}")
+        for name in ready:
+            ordered.add(name)
+            del remaining[name]
+
+def _graph_node(name, timings, intervals, fn, *args):
+    start = time.perf_counter()
+    try:
+        return _timed(name, timings, fn, *args)
+    finally:
+        intervals[name] = (start, time.perf_counter())
+
+def critical_path(graph, intervals):
+    if not intervals:
+        return []
+    path = [max(intervals, key=lambda name: intervals[name][1])]
+    while True:
+        finished = [dependency for dependency in graph[path[-1]][0] if dependency in intervals]
+        if not finished:
+            return path[::-1]
+        path.append(max(finished, key=lambda name: intervals[name][1]))
+
+def plan_table_stages(result, summarize):
+    # One entry per table in display order: the stage that summarizes it, or the conversion error
+    stages = {}
+    table_slots = []
+    table_dataframes = []
+    for i, table in enumerate(result.tables[:3]):
+        try:
+            df = convert_table_to_dataframe(table)
+        except Exception as e:
+            table_slots.append((None, f"Error processing table {i+1}: {str(e)}"))
+            continue
+        table_dataframes.append(df)
+        stages[f"table_{i}"] = (summarize, df, i)
+        table_slots.append((f"table_{i}", f"Error processing table {i+1}"))
+    return stages, table_slots, table_dataframes
+
+def finish_stage_results(results, table_slots, table_dataframes, on_update=None):
+    for name, value in results.items():
+        if isinstance(value, Exception):
+            report_error(f"{name.replace('_', ' ').capitalize()} failed: {str(value)}")
+            results[name] = None
+
+    results["table_summaries"] = [
+        (results.pop(name) if name else None) or message for name, message in table_slots
+    ]
+    results["table_dataframes"] = table_dataframes
+    if on_update is not None:
+        on_update("tables", (results["table_summaries"], table_dataframes))
+    return results
+
+def get_image_name(analysis_result, index):
+    # analysis_result is None for an image whose captioning failed
+    if analysis_result is None:
+        return f"Image {index}"
+    if analysis_result.description and analysis_result.description.captions:
+        caption = analysis_result.description.captions[0].text.strip()
+        generic_terms = ["diagram", "chart", "graph", "image", "picture"]
+        if caption.lower() in generic_terms:
+            if analysis_result.objects:
+                objects = ", ".join([obj.object_property for obj in analysis_result.objects])
+                return f"{caption} of {objects}"
+            else:
+                return caption
+        else:
+            return caption
+    elif analysis_result.objects:
+        return ", ".join([obj.object_property for obj in analysis_result.objects])
+    else:
+        return f"Image {index}"
+
+def normalize_pdf(file_bytes, compress=PDF_COMPRESS):
+    # Returns the bytes to upload and the opened document, so the image stage does not parse
+    # the file again. Well-formed, unencrypted PDFs are uploaded as-is; anything PyMuPDF had
+    # to repair or decrypt is rewritten in a single pass. The rewrite keeps the trailer /ID
+    # (no_new_id), so the same upload always gives the same bytes and layout cache key.
+    import fitz
+
+    with PDF_LOCK:
+        pdf_doc = fitz.open(stream=file_bytes, filetype="pdf")
+        if pdf_doc.is_repaired or pdf_doc.metadata.get("encryption") or compress:
+            file_bytes = pdf_doc.tobytes(
+                garbage=3 if compress else 0,
+                deflate=compress,
+                encryption=fitz.PDF_ENCRYPT_NONE,
+                no_new_id=True,
+            )
+    return file_bytes, pdf_doc
+
+def preprocess_pdf(file_bytes, compress=PDF_COMPRESS):
+    return normalize_pdf(file_bytes, compress)[0]
+
+
+def split_pdf(file_bytes, shard_pages):
+    # Returns (index of first page, PDF bytes) for consecutive page ranges of shard_pages pages
+    import fitz
+
+    shards = []
+    with PDF_LOCK:
+        pdf_doc = fitz.open(stream=file_bytes, filetype="pdf")
+        for first_page in range(0, pdf_doc.page_count, shard_pages):
+            shard = fitz.open()
+            shard.insert_pdf(pdf_doc, from_page=first_page, to_page=min(first_page + shard_pages, pdf_doc.page_count) - 1)
+            # A fixed trailer /ID keeps each shard's bytes, and so its cache key, stable across runs
+            shards.append((first_page, shard.tobytes(garbage=1, no_new_id=True)))
+    return shards
+
+def _shift_layout_dict(node, page_map, content_offset):
+    # Every bounding region and page carries a page_number, and every span is an
+    # {offset, length} pair into result.content, wherever they sit in the tree
+    if isinstance(node, list):
+        for item in node:
+            _shift_layout_dict(item, page_map, content_offset)
+    elif isinstance(node, dict):
+        if isinstance(node.get("page_number"), int):
+            node["page_number"] = page_map(node["page_number"])
+        if set(node) == {"offset", "length"}:
+            node["offset"] += content_offset
+        for value in node.values():
+            if isinstance(value, (list, dict)):
+                _shift_layout_dict(value, page_map, content_offset)
+
+def merge_layout_results(shard_results):
+    # shard_results: (index of first page, AnalyzeResult) in page order. Pages, paragraphs
+    # and tables are concatenated shard by shard, so reading order is unchanged.
+    from azure.ai.formrecognizer import AnalyzeResult
+
+    merged = None
+    for first_page, result in shard_results:
+        data = result.to_dict()
+        if merged is None:
+            _shift_layout_dict(data, lambda number: number + first_page, 0)
+            merged = data
+            continue
+        content_offset = len(merged["content"] or "") + 1
+        _shift_layout_dict(data, lambda number: number + first_page, content_offset)
+        merged["content"] = f"{merged['content'] or ''}\n{data['content'] or ''}"
+        for key in ("pages", "paragraphs", "tables", "key_value_pairs", "styles", "languages", "documents"):
+            if data.get(key):
+                merged[key] = (merged.get(key) or []) + data[key]
+    return AnalyzeResult.from_dict(merged)
+
+def page_needs_ocr(page, check_tables=True):
+    # Born-digital pages have a usable text layer; scans, pages whose fonts do not map to
+    # Unicode, and (when tables are wanted) pages with tables still go to Form Recognizer
+    import fitz
+
+    text = page.get_text("text").strip()
+    if len(text) < LOCAL_TEXT_MIN_CHARS:
+        return True
+    if text.count("\ufffd") > 0.05 * len(text):
+        return True
+    page_area = abs(page.rect)
+    glyph_area = sum(abs(fitz.Rect(word[:4]) & page.rect) for word in page.get_text("words"))
+    image_area = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    if image_area > 0.5 * page_area and glyph_area < LOCAL_TEXT_MIN_GLYPH_COVERAGE * page_area:
+        return True
+    return check_tables and bool(page.find_tables().tables)
+
+def _polygon(bbox):
+    x0, y0, x1, y1 = (value / 72 for value in bbox)
+    return [{"x": x0, "y": y0}, {"x": x1, "y": y0}, {"x": x1, "y": y1}, {"x": x0, "y": y1}]
+
+def build_local_layout(pdf_doc, page_indexes):
+    # An AnalyzeResult-shaped dict from PyMuPDF's text layer: one line per text line and
+    # one paragraph per text block, in inches like Form Recognizer reports for PDFs
+    import fitz
+
+    content = []
+    offset = 0
+    pages = []
+    paragraphs = []
+    for page_index in page_indexes:
+        page = pdf_doc[page_index]
+        page_start = offset
+        lines = []
+        for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+            block_start = offset
+            block_lines = []
+            for line in block.get("lines", []):
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                if not text:
+                    continue
+                lines.append({"content": text, "polygon": _polygon(line["bbox"]), "spans": [{"offset": offset, "length": len(text)}]})
+                block_lines.append(text)
+                offset += len(text) + 1
+            if block_lines:
+                content.extend(block_lines)
+                paragraphs.append({
+                    "role": None,
+                    "content": "\n".join(block_lines),
+                    "bounding_regions": [{"page_number": page_index + 1, "polygon": _polygon(block["bbox"])}],
+                    "spans": [{"offset": block_start, "length": offset - block_start - 1}],
+                })
+        pages.append({
+            "page_number": page_index + 1,
+            "angle": 0,
+            "width": page.rect.width / 72,
+            "height": page.rect.height / 72,
+            "unit": "inch",
+            "lines": lines,
+            "spans": [{"offset": page_start, "length": max(0, offset - page_start - 1)}],
+        })
+    return {"model_id": "prebuilt-layout", "content": "\n".join(content), "pages": pages, "paragraphs": paragraphs, "tables": []}
+
+def split_local_layout(file_bytes, pdf_doc=None, check_tables=LOCAL_TEXT_TABLES):
+    # The local layout of the pages with a usable text layer, the 0-based indexes of the pages
+    # that still need OCR, and a PDF of just those pages. local is None when every page needs
+    # OCR, and the PDF is None when none does.
+    import fitz
+
+    with PDF_LOCK:
+        if pdf_doc is None:
+            pdf_doc = fitz.open(stream=file_bytes, filetype="pdf")
+        remote_pages = [i for i in range(pdf_doc.page_count) if page_needs_ocr(pdf_doc[i], check_tables)]
+        if len(remote_pages) == pdf_doc.page_count:
+            return None, remote_pages, file_bytes
+        remote_set = set(remote_pages)
+        local = build_local_layout(pdf_doc, [i for i in range(pdf_doc.page_count) if i not in remote_set])
+        if not remote_pages:
+            return local, remote_pages, None
+        remote_doc = fitz.open(stream=file_bytes, filetype="pdf")
+        remote_doc.select(remote_pages)
+        return local, remote_pages, remote_doc.tobytes(garbage=1, no_new_id=True)
+
+def merge_local_layout(local, remote_result, remote_pages):
+    # remote_result covers remote_pages (0-based, ascending) as pages 1..n of a cut-down PDF.
+    # Its content keeps its own offsets and the local text follows it; pages, paragraphs
+    # and tables are then put back in document order.
+    from azure.ai.formrecognizer import AnalyzeResult
+
+    merged = remote_result.to_dict()
+    _shift_layout_dict(merged, lambda number: remote_pages[number - 1] + 1, 0)
+    _shift_layout_dict(local, lambda number: number, len(merged["content"] or "") + 1)
+    merged["content"] = f"{merged['content'] or ''}\n{local['content']}"
+
+    def first_page(item):
+        regions = item.get("bounding_regions") or [{"page_number": 0}]
+        return regions[0]["page_number"]
+
+    merged["pages"] = sorted((merged.get("pages") or []) + local["pages"], key=lambda page: page["page_number"])
+    merged["paragraphs"] = sorted((merged.get("paragraphs") or []) + local["paragraphs"], key=first_page)
+    merged["tables"] = sorted(merged.get("tables") or [], key=first_page)
+    return AnalyzeResult.from_dict(merged)
+
+def make_thumbnail(image_data, max_side=THUMBNAIL_MAX_SIDE):
+    # Image.open only parses the header; draft() lets the JPEG decoder scale down while
+    # decoding, so a large photo is never held in memory at full resolution
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_data))
+    image.draft(image.mode if image.mode in ("RGB", "L") else "RGB", (max_side, max_side))
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    return image
+
+def prepare_vision_upload(image_data, max_side=VISION_MAX_SIDE, quality=VISION_JPEG_QUALITY):
+    from PIL import Image
+
+    header = Image.open(io.BytesIO(image_data))
+    # A long thin banner is shrunk only as far as keeps its short side at VISION_MIN_SIDE, and
+    # never enlarged
+    longest, shortest = max(header.size), min(header.size)
+    max_side = min(longest, max(max_side, -(-longest * VISION_MIN_SIDE // max(1, shortest))))
+    within_limits = longest <= max_side and header.format in VISION_FORMATS
+    if within_limits and len(image_data) <= VISION_REUSE_MAX_BYTES:
+        return image_data
+    image = make_thumbnail(image_data, max_side)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    encoded = output.getvalue()
+    # A large but already compact original can beat the re-encode; keep whichever is smaller
+    if within_limits and len(image_data) <= len(encoded):
+        return image_data
+    return encoded
+
+def caption_image(processor, image_data):
+    from azure.cognitiveservices.vision.computervision.models import VisualFeatureTypes
+
+    start = time.perf_counter()
+    upload = prepare_vision_upload(image_data)
+    encode_seconds = time.perf_counter() - start
+    VISION_RATE_LIMITER.wait()
+    start = time.perf_counter()
+    with span("analyze_image_in_stream", bytes=len(upload)):
+        result = processor.vision_client.analyze_image_in_stream(io.BytesIO(upload), [VisualFeatureTypes.description])
+    vision_upload_stats.record(len(image_data), len(upload), encode_seconds, time.perf_counter() - start)
+    return result
+
+def find_cached_captions(caption_cache, images):
+    # The dHash of every image, and the cached captions of the images seen before
+    captions = {}
+    hashes = {}
+    for key, image_data in images.items():
+        hashes[key] = dhash(image_data)
+        if hashes[key] is None:
+            continue
+        cached = caption_cache.get(hashes[key])
+        if cached is not None:
+            captions[key] = cached
+    return hashes, captions
+
+def caption_images(processor, images, max_workers=VISION_CONCURRENCY):
+    # images maps a key to encoded image bytes. Near-duplicates of anything captioned
+    # before come from the caption cache; the rest are captioned in parallel and cached.
+    # An image whose captioning fails gets None and is reported; the others keep theirs.
+    hashes, captions = find_cached_captions(processor.caption_cache, images)
+    results = run_stages(
+        {key: (caption_image, processor, image_data)
+         for key, image_data in images.items() if key not in captions},
+        max_workers,
+    )
+    for key, value in results.items():
+        if isinstance(value, Exception):
+            continue
+        if hashes[key] is not None:
+            processor.caption_cache.put(hashes[key], value)
+    return add_caption_results(captions, results)
+
+def add_caption_results(captions, results):
+    failed = [value for value in results.values() if isinstance(value, Exception)]
+    if failed:
+        report_error(f"Captioning {len(failed)} of {len(results)} images failed: {failed[0]}")
+    captions.update((key, None if isinstance(value, Exception) else value) for key, value in results.items())
+    return captions
+
+def collect_pdf_images(pdf_doc):
+    # A logo repeated on every page is one xref (or, across xrefs, the same bytes): each
+    # distinct image is extracted once, keyed by digest, and (page index, digest) records every
+    # place it occurs. PyMuPDF reports pixel sizes from the image dictionary, so the digests
+    # of images large enough to caption are found without decoding.
+    occurrences = []
+    xref_digests = {}
+    images = {}
+    captioned = []
+    with PDF_LOCK:
+        for page_index in range(pdf_doc.page_count):
+            for img_info in pdf_doc[page_index].get_images(full=True):
+                xref, width, height = img_info[0], img_info[2], img_info[3]
+                if xref not in xref_digests:
+                    image_data = pdf_doc.extract_image(xref)["image"]
+                    digest = hashlib.sha256(image_data).hexdigest()
+                    xref_digests[xref] = digest
+                    if digest not in images:
+                        images[digest] = image_data
+                        if min(width, height) >= VISION_MIN_SIDE:
+                            captioned.append(digest)
+                occurrences.append((page_index, xref_digests[xref]))
+    return occurrences, images, captioned
+
+def name_pdf_images(occurrences, thumbnails, results):
+    # Fans each distinct image's caption out to every page it occurs on; only bounded
+    # thumbnails are kept for display
+    image_objects = []
+    for page_index, digest in occurrences:
+        if digest not in results:
+            image_objects.append((f"Small Image {len(image_objects) + 1} (Page {page_index + 1})", thumbnails[digest]))
+            continue
+        image_name = get_image_name(results[digest], len(image_objects) + 1)
+        image_objects.append((f"{image_name} (Page {page_index + 1})", thumbnails[digest]))
+    return image_objects
+
+def open_pdf(file_bytes):
+    import fitz
+
+    with PDF_LOCK:
+        return fitz.open(stream=file_bytes, filetype="pdf")
+
+def extract_images(processor, file_bytes, file_type, pdf_doc=None, max_workers=VISION_CONCURRENCY):
+    from PIL import Image
+
+    image_objects = []
+    if file_type == "application/pdf":
+        if pdf_doc is None:
+            pdf_doc = open_pdf(file_bytes)
+        occurrences, images, captioned = collect_pdf_images(pdf_doc)
+        results = caption_images(processor, {digest: images[digest] for digest in captioned}, max_workers)
+        thumbnails = {digest: make_thumbnail(image_data) for digest, image_data in images.items()}
+        del images
+        image_objects = name_pdf_images(occurrences, thumbnails, results)
+    elif file_type in ["image/png", "image/jpeg"]:
+        image = Image.open(io.BytesIO(file_bytes))
+        if min(image.size) < VISION_MIN_SIDE:
+            image_objects.append((f"Small Image {len(image_objects) + 1}", make_thumbnail(file_bytes)))
+        else:
+            analysis_result = caption_images(processor, {0: file_bytes})[0]
+            image_name = get_image_name(analysis_result, len(image_objects) + 1)
+            image_objects.append((image_name, make_thumbnail(file_bytes)))
+    return image_objects
+
+# Stages a caller may switch off; whatever depends only on them is skipped too
+OPTIONAL_STAGES = ("overall_summary", "section_summary", "classification", "keywords", "citations_references",
+                   "tables", "images")
+
+def _layout_stage(processor, prepared):
+    file_bytes, pdf_doc = prepared
+    if pdf_doc is not None and LOCAL_TEXT_FAST_PATH:
+        result = processor.analyze_layout_local_first(file_bytes, pdf_doc)
+    else:
+        result = processor.analyze_layout(file_bytes)
+    return result, get_result_text(result)
+
+def _sections_stage(processor, layout):
+    result, text = layout
+    return processor.segment_sections(text, result)
+
+def _condense_stage(max_workers, layout):
+    result, text = layout
+    return condense_document(result, text, max_workers=max_workers)
+
+def _combined_stage(layout):
+    # The single structured call needs the whole document, so it is only used when it fits
+    # and never waits for condense. Fields it does not return, or all of them when it fails,
+    # are requested by their own stages.
+    result, text = layout
+    if estimate_tokens(text) > CHUNK_TOKEN_BUDGET:
+        return {}
+    try:
+        return generate_combined_analysis(text)
+    except Exception as e:
+        report_error(f"Combined analysis failed: {str(e)}")
+        return {}
+
+def _text_stage(name, on_update, source, combined_results=None):
+    # source is the condense digest, or the layout for stages that need the verbatim text
+    text = source[1] if isinstance(source, tuple) else source
+    if combined_results and name in combined_results:
+        value = combined_results[name]
+        if on_update is not None:
+            on_update(name, value)
+        return value
+    if on_update is not None:
+        return _streamed_stage(name, on_update, TEXT_STAGES[name], text)
+    return TEXT_STAGES[name](text)
+
+def _tables_stage(max_workers, timings, on_update, layout):
+    result, _ = layout
+    stages, table_slots, table_dataframes = plan_table_stages(result, summarize_table)
+    results = finish_stage_results(run_stages(stages, max_workers, timings), table_slots, table_dataframes, on_update)
+    return results["table_summaries"], results["table_dataframes"]
+
+def _images_stage(processor, file_type, on_update, prepared):
+    file_bytes, pdf_doc = prepared
+    images = extract_images(processor, file_bytes, file_type, pdf_doc)
+    if on_update is not None:
+        on_update("images", images)
+    return images
+
+def build_document_graph(processor, file_bytes, file_type, max_workers=ANALYSIS_CONCURRENCY, combined=COMBINED_ANALYSIS,
+                         timings=None, on_update=None):
+    # The pipeline as a run_graph graph: bytes -> layout -> sections, condense, summaries and
+    # tables, and bytes -> images. Summaries and classification read the map-reduce digest of
+    # long documents; key terms and citations still need the verbatim text. With on_update,
+    # text stages stream their tokens, and tables and images report when they finish.
+    graph = {}
+    prepared = ((file_bytes, None),)
+    dependencies = ()
+    if file_type == "application/pdf":
+        graph["preprocess"] = ((), normalize_pdf, file_bytes)
+        prepared = ()
+        dependencies = ("preprocess",)
+    graph["layout"] = (dependencies, _layout_stage, processor, *prepared)
+    graph["images"] = (dependencies, _images_stage, processor, file_type, on_update, *prepared)
+    graph["sections"] = (("layout",), _sections_stage, processor)
+    graph["condense"] = (("layout",), _condense_stage, max_workers)
+    if combined:
+        graph["combined_analysis"] = (("layout",), _combined_stage)
+    for name in TEXT_STAGES:
+        source = "condense" if name in ("overall_summary", "section_summary", "classification") else "layout"
+        graph[name] = ((source, "combined_analysis") if combined else (source,), _text_stage, name, on_update)
+    graph["tables"] = (("layout",), _tables_stage, max_workers, timings, on_update)
+    return graph
+
+def disabled_graph_stages(graph, disabled_stages=(), include_images=True):
+    # The stages to switch off, plus the intermediate stages nothing left running would read
+    unknown = set(disabled_stages) - set(OPTIONAL_STAGES)
+    if unknown:
+        raise ValueError(f"These stages cannot be switched off: {', '.join(sorted(unknown))}")
+    disabled = set(disabled_stages)
+    if not include_images:
+        disabled.add("images")
+    for name in ("combined_analysis", "condense"):
+        readers = [other for other, (dependencies, *_) in graph.items() if name in dependencies]
+        if name in graph and all(reader in disabled for reader in readers):
+            disabled.add(name)
+    return disabled
+
+def collect_document_results(results, file_bytes):
+    # The analyze_document dict from the document graph's results. Preprocessing and OCR
+    # failures are raised; other failed stages are reported and left as None.
+    for name in ("preprocess", "layout"):
+        if isinstance(results.get(name), Exception):
+            raise results[name]
+    for name, value in results.items():
+        if isinstance(value, Exception):
+            report_error(f"{name.replace('_', ' ').capitalize()} failed: {str(value)}")
+            results[name] = None
+    file_bytes, pdf_doc = results.get("preprocess") or (file_bytes, None)
+    result, extracted_text = results["layout"]
+    table_summaries, table_dataframes = results["tables"] or ([], [])
+    analysis = {name: results[name] for name in TEXT_STAGES}
+    analysis.update({
+        "table_summaries": table_summaries,
+        "table_dataframes": table_dataframes,
+        "file_bytes": file_bytes,
+        "pdf_document": pdf_doc,
+        "layout_result": result,
+        "extracted_text": extracted_text,
+        "sections": results["sections"],
+        "images": results["images"],
+    })
+    return analysis
+
+def analyze_document(processor, file_bytes, file_type, max_workers=ANALYSIS_CONCURRENCY,
+                     combined=COMBINED_ANALYSIS, include_images=True, on_update=None, disabled_stages=()):
+    # The whole pipeline for one document, with no UI. Returns every value the app renders,
+    # the bytes that were sent to OCR, per-stage wall-clock seconds, the critical path of stages
+    # and the errors stages reported; switched-off stages are None. Failures before analysis
+    # starts (bad file, OCR error) are raised to the caller. Every stage and external call is
+    # also recorded as a span in the returned trace.
+    errors = []
+    timings = {}
+    trace = Trace()
+    token = _error_sink.set(errors)
+    trace_token = _trace_sink.set(trace)
+    slots_token = _openai_slots.set(threading.BoundedSemaphore(max(1, max_workers)))
+    try:
+        with stage_timer(timings, "total"):
+            graph = build_document_graph(processor, file_bytes, file_type, max_workers, combined, timings, on_update)
+            results, path = run_graph(graph, timings, disabled_graph_stages(graph, disabled_stages, include_images))
+        analysis = collect_document_results(results, file_bytes)
+    finally:
+        _openai_slots.reset(slots_token)
+        _trace_sink.reset(trace_token)
+        _error_sink.reset(token)
+        export_metrics()
+    analysis.update({
+        "timings": timings,
+        "critical_path": path,
+        "trace": trace,
+        "errors": errors,
+    })
+    return analysis
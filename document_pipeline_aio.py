@@ -0,0 +1,503 @@
+import aiohttp
+from azure.ai.formrecognizer import AnalyzeResult
+from azure.ai.formrecognizer.aio import DocumentAnalysisClient
+from azure.core.credentials import AzureKeyCredential
+from azure.ai.textanalytics import ExtractiveSummaryAction
+from azure.ai.textanalytics.aio import TextAnalyticsClient
+from azure.cognitiveservices.vision.computervision.models import VisualFeatureTypes, ImageAnalysis
+from PIL import Image
+import asyncio
+import contextlib
+import contextvars
+import io
+import time
+import weakref
+
+from document_pipeline import (
+    ANALYSIS_CONCURRENCY, AZURE_COMPUTER_VISION_ENDPOINT, AZURE_COMPUTER_VISION_KEY, AZURE_LANGUAGE_ENDPOINT,
+    AZURE_LANGUAGE_KEY, CHUNK_TOKEN_BUDGET, COMBINED_ANALYSIS, COMBINED_ANALYSIS_SCHEMA, DOC_INTEL_ENDPOINT,
+    DOC_INTEL_KEY, EXTRACTIVE_CONCURRENCY, EXTRACTIVE_SUMMARY_MODE, LOCAL_TEXT_FAST_PATH, LOCAL_TEXT_TABLES,
+    OCR_SHARD_CONCURRENCY, OCR_SHARD_PAGES, OPENAI_API_VERSION, OPENAI_CONNECT_TIMEOUT, OPENAI_MAX_RETRIES,
+    OPENAI_READ_TIMEOUT, OPENAI_STRUCTURED_API_VERSION, PROMPTS, RETRYABLE_STATUS_CODES, TEXT_STAGES,
+    VISION_CONCURRENCY, VISION_MIN_SIDE, VISION_RATE_LIMITER, Sections, Trace, _error_sink, _token_sink,
+    _trace_sink, add_caption_results, add_extractive_results, chat_request, check_graph, chunk_document,
+    collect_chunk_summaries, collect_document_results, collect_pdf_images, convert_table_to_dataframe,
+    critical_path, disabled_graph_stages, estimate_tokens, estimate_usage, export_metrics, find_cached_captions,
+    find_section_spans, finish_extractive_summaries, finish_stage_results, get_backoff_delay, get_caption_cache,
+    get_image_name, get_layout_cache, get_result_text, get_retry_after, group_summaries, make_thumbnail,
+    merge_layout_results, merge_local_layout, name_pdf_images, normalize_pdf, open_pdf, parse_combined_analysis,
+    plan_extractive_summaries, plan_table_stages, prepare_vision_upload, read_chat_event, report_error, span,
+    split_local_layout, split_pdf, stage_timer, stream_updates, vision_upload_stats,
+)
+
+# The pipeline of document_pipeline as coroutines, for callers that run many documents in one
+# event loop. Function names, arguments and results match the threaded versions; network calls
+# are awaited, and PyMuPDF, Pillow and cache file work runs in worker threads so the loop
+# keeps serving the other documents' stages.
+
+# The asyncio counterpart of document_pipeline's per-document bound on OpenAI calls in flight
+_openai_slots = contextvars.ContextVar("aio_openai_slots", default=None)
+
+_http_sessions = weakref.WeakKeyDictionary()
+
+def get_http_session():
+    # One keep-alive pool per event loop, shared by every stage on it; an aiohttp session
+    # cannot be used from another loop
+    loop = asyncio.get_running_loop()
+    session = _http_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession()
+        _http_sessions[loop] = session
+    return session
+
+async def close_http_session():
+    session = _http_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+async def post_with_retries(url, max_retries=OPENAI_MAX_RETRIES, timeout=None, **kwargs):
+    # timeout is (connect, read) seconds or one number for both, as for requests; the caller
+    # reads the returned response and releases it
+    session = get_http_session()
+    timeout = timeout or (OPENAI_CONNECT_TIMEOUT, OPENAI_READ_TIMEOUT)
+    connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+    for attempt in range(max_retries + 1):
+        try:
+            response = await session.post(url, timeout=client_timeout, **kwargs)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == max_retries:
+                raise
+            await asyncio.sleep(get_backoff_delay(attempt))
+            continue
+        if response.status in RETRYABLE_STATUS_CODES and attempt < max_retries:
+            response.release()
+            await asyncio.sleep(get_backoff_delay(attempt, get_retry_after(response)))
+            continue
+        response.raise_for_status()
+        return response
+
+class ComputerVisionClient:
+    # The Computer Vision SDK has no asyncio client, so this makes the REST call behind
+    # ComputerVisionClient.analyze_image_in_stream and returns the same ImageAnalysis model
+    def __init__(self, endpoint, key):
+        self.url = f"{(endpoint or '').rstrip('/')}/vision/v3.2/analyze"
+        self.key = key
+
+    async def analyze_image_in_stream(self, image, visual_features, language="en", model_version="latest"):
+        params = {
+            "visualFeatures": ",".join(feature.value for feature in visual_features),
+            "language": language,
+            "model-version": model_version,
+        }
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/octet-stream",
+            "Ocp-Apim-Subscription-Key": self.key,
+        }
+        response = await post_with_retries(self.url, params=params, headers=headers, data=image)
+        async with response:
+            return ImageAnalysis.deserialize(await response.json(content_type=None))
+
+class AsyncDocumentProcessor:
+    # Use as "async with AsyncDocumentProcessor() as processor:" so the clients and the loop's
+    # HTTP session are closed with it. The layout and caption caches are the process-wide ones.
+    def __init__(self):
+        self.form_recognizer_client = DocumentAnalysisClient(
+            endpoint=DOC_INTEL_ENDPOINT,
+            credential=AzureKeyCredential(DOC_INTEL_KEY)
+        )
+        self.language_client = TextAnalyticsClient(
+            endpoint=AZURE_LANGUAGE_ENDPOINT,
+            credential=AzureKeyCredential(AZURE_LANGUAGE_KEY)
+        )
+        self.vision_client = ComputerVisionClient(AZURE_COMPUTER_VISION_ENDPOINT, AZURE_COMPUTER_VISION_KEY)
+        self.layout_cache = get_layout_cache()
+        self.caption_cache = get_caption_cache()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.form_recognizer_client.close()
+        await self.language_client.close()
+        await close_http_session()
+
+    async def analyze_cached(self, document, model_id="prebuilt-layout"):
+        # LayoutCache.analyze, with the cache's disk I/O in a worker thread
+        result = await asyncio.to_thread(self.layout_cache.get, document, model_id)
+        if result is None:
+            with span("begin_analyze_document", model_id=model_id, bytes=len(document)):
+                poller = await self.form_recognizer_client.begin_analyze_document(model_id=model_id, document=document)
+                result = await poller.result()
+            await asyncio.to_thread(self.layout_cache.put, document, model_id, result)
+        return result
+
+    async def analyze_layout(self, document, model_id="prebuilt-layout", shard_pages=OCR_SHARD_PAGES,
+                             max_workers=OCR_SHARD_CONCURRENCY):
+        if shard_pages > 0 and document[:5] == b"%PDF-":
+            shards = await asyncio.to_thread(split_pdf, document, shard_pages)
+            if len(shards) > 1:
+                return await self.analyze_layout_shards(shards, model_id, max_workers)
+        return await self.analyze_cached(document, model_id)
+
+    async def analyze_layout_local_first(self, file_bytes, pdf_doc=None, model_id="prebuilt-layout",
+                                         check_tables=LOCAL_TEXT_TABLES):
+        local, remote_pages, remote_bytes = await asyncio.to_thread(split_local_layout, file_bytes, pdf_doc, check_tables)
+        if local is None:
+            return await self.analyze_layout(file_bytes, model_id)
+        if not remote_pages:
+            return AnalyzeResult.from_dict(local)
+        remote_result = await self.analyze_layout(remote_bytes, model_id)
+        return await asyncio.to_thread(merge_local_layout, local, remote_result, remote_pages)
+
+    async def analyze_layout_shards(self, shards, model_id="prebuilt-layout", max_workers=OCR_SHARD_CONCURRENCY):
+        results = await run_stages(
+            {i: (self.analyze_cached, shard, model_id) for i, (_, shard) in enumerate(shards)},
+            max_workers,
+        )
+        for i in range(len(shards)):
+            if isinstance(results[i], Exception):
+                raise results[i]
+        return await asyncio.to_thread(merge_layout_results, [(first_page, results[i]) for i, (first_page, _) in enumerate(shards)])
+
+    async def extract_text(self, uploaded_file):
+        result = await self.analyze_layout(uploaded_file.read())
+        return result, get_result_text(result)
+
+    def segment_sections(self, text, result=None):
+        return Sections(text, find_section_spans(text, result))
+
+    async def generate_extractive_summary(self, text, max_sentences=3, mode=EXTRACTIVE_SUMMARY_MODE):
+        return (await self.generate_extractive_summaries({"text": text}, max_sentences, mode))["text"]
+
+    async def generate_extractive_summaries(self, texts, max_sentences=3, mode=EXTRACTIVE_SUMMARY_MODE):
+        summaries, remote_keys, batches = plan_extractive_summaries(texts, max_sentences, mode)
+        semaphore = asyncio.Semaphore(EXTRACTIVE_CONCURRENCY)
+
+        async def summarize_batch(batch):
+            async with semaphore:
+                with span("begin_analyze_actions", documents=len(batch)):
+                    poller = await self.language_client.begin_analyze_actions(
+                        documents=batch,
+                        actions=[ExtractiveSummaryAction(max_sentence_count=max_sentences)]
+                    )
+                    return [result async for result in await poller.result()]
+
+        for document_results in await asyncio.gather(*(summarize_batch(batch) for batch in batches)):
+            add_extractive_results(summaries, document_results, remote_keys, texts, max_sentences)
+        finish_extractive_summaries(summaries, max_sentences)
+        return {key: summaries[key] for key in texts}
+
+async def read_chat_stream(response, on_token, usage=None):
+    parts = []
+    async with response:
+        async for line in response.content:
+            if not read_chat_event(line, parts, on_token, usage):
+                break
+    return "".join(parts)
+
+async def generate_openai_response(prompt, max_tokens=500, timeout=None, response_format=None, api_version=OPENAI_API_VERSION):
+    on_token = _token_sink.get()
+    try:
+        url, params, headers, payload = chat_request(prompt, max_tokens, response_format, api_version, on_token is not None)
+        async with _openai_slots.get() or contextlib.nullcontext():
+            with span("generate_openai_response", max_tokens=max_tokens, stream=on_token is not None) as attributes:
+                response = await post_with_retries(url, headers=headers, params=params, json=payload, timeout=timeout)
+                usage = {}
+                if on_token is not None:
+                    content = await read_chat_stream(response, on_token, usage)
+                    usage = usage or estimate_usage(prompt, content)
+                else:
+                    async with response:
+                        body = await response.json(content_type=None)
+                    usage = body.get("usage") or {}
+                    content = body["choices"][0]["message"]["content"]
+                attributes.update({key: usage[key] for key in ("prompt_tokens", "completion_tokens", "total_tokens", "usage_estimated") if key in usage})
+        return content
+    except Exception as e:
+        report_error(f"OpenAI API error: {str(e)}")
+        return None
+
+async def generate_overall_summary(text):
+    return await generate_openai_response(PROMPTS["overall_summary"].format(text))
+
+async def generate_section_summary(text):
+    return await generate_openai_response(PROMPTS["section_summary"].format(text))
+
+async def generate_summaries(text):
+    return tuple(await asyncio.gather(generate_overall_summary(text), generate_section_summary(text)))
+
+async def classify_document(text):
+    return await generate_openai_response(PROMPTS["classification"].format(text))
+
+async def summarize_table(df, index):
+    summary = await generate_openai_response(PROMPTS["table"].format(df.to_string()), 100)
+    return f"Table {index+1} Summary:\n{summary}"
+
+async def analyze_visual_elements(result):
+    table_summaries = []
+    table_dataframes = []
+    for i, table in enumerate(result.tables[:3]):
+        try:
+            df = convert_table_to_dataframe(table)
+            table_dataframes.append(df)
+            table_summaries.append(await summarize_table(df, i))
+        except Exception as e:
+            table_summaries.append(f"Error processing table {i+1}: {str(e)}")
+    return table_summaries, table_dataframes
+
+async def extract_keywords(text):
+    return await generate_openai_response(PROMPTS["keywords"].format(text))
+
+async def extract_citations_references(text):
+    return await generate_openai_response(PROMPTS["citations_references"].format(text))
+
+ASYNC_TEXT_STAGES = {
+    "overall_summary": generate_overall_summary,
+    "section_summary": generate_section_summary,
+    "classification": classify_document,
+    "keywords": extract_keywords,
+    "citations_references": extract_citations_references,
+}
+
+async def generate_combined_analysis(text):
+    content = await generate_openai_response(
+        PROMPTS["combined_analysis"].format(text),
+        max_tokens=500 * len(TEXT_STAGES),
+        response_format={"type": "json_schema", "json_schema": COMBINED_ANALYSIS_SCHEMA},
+        api_version=OPENAI_STRUCTURED_API_VERSION,
+    )
+    return parse_combined_analysis(content)
+
+async def summarize_chunks(prompt_template, chunks, max_workers=ANALYSIS_CONCURRENCY, token_budget=CHUNK_TOKEN_BUDGET):
+    results = await run_stages(
+        {i: (generate_openai_response, prompt_template.format(chunk)) for i, chunk in enumerate(chunks)},
+        max_workers,
+    )
+    return collect_chunk_summaries(results, chunks, token_budget)
+
+async def condense_document(result, text, token_budget=CHUNK_TOKEN_BUDGET, max_workers=ANALYSIS_CONCURRENCY):
+    if estimate_tokens(text) <= token_budget:
+        return text
+    summaries = await summarize_chunks(PROMPTS["condense"], chunk_document(result, token_budget), max_workers, token_budget)
+    while len(summaries) > 1 and estimate_tokens("\n\n".join(summaries)) > token_budget:
+        merged = await summarize_chunks(PROMPTS["merge"], group_summaries(summaries, token_budget), max_workers, token_budget)
+        if len(merged) >= len(summaries):
+            break
+        summaries = merged
+    return "\n\n".join(summaries)
+
+async def _timed(name, timings, fn, *args):
+    if timings is None:
+        return await fn(*args)
+    with stage_timer(timings, name):
+        return await fn(*args)
+
+async def _streamed_stage(name, on_update, fn, *args):
+    token = _token_sink.set(stream_updates(name, on_update))
+    try:
+        value = await fn(*args)
+    finally:
+        _token_sink.reset(token)
+    on_update(name, value)
+    return value
+
+async def run_stages(stages, max_workers=ANALYSIS_CONCURRENCY, timings=None):
+    # stages maps a result slot to (coroutine function, *args). Each stage is a task on the
+    # running loop, at most max_workers of them past the semaphore at once; as in the threaded
+    # run_stages, a failing stage leaves its exception in its slot and the rest carry on.
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def run(name, fn, *args):
+        async with semaphore:
+            return await _timed(name, timings, fn, *args)
+
+    names = list(stages)
+    values = await asyncio.gather(*(run(name, *stages[name]) for name in names), return_exceptions=True)
+    return dict(zip(names, values))
+
+async def caption_image(processor, image_data):
+    start = time.perf_counter()
+    upload = await asyncio.to_thread(prepare_vision_upload, image_data)
+    encode_seconds = time.perf_counter() - start
+    # The rate limit is shared with the threaded pipeline in this process
+    await asyncio.sleep(VISION_RATE_LIMITER.reserve())
+    start = time.perf_counter()
+    with span("analyze_image_in_stream", bytes=len(upload)):
+        result = await processor.vision_client.analyze_image_in_stream(upload, [VisualFeatureTypes.description])
+    vision_upload_stats.record(len(image_data), len(upload), encode_seconds, time.perf_counter() - start)
+    return result
+
+async def caption_images(processor, images, max_workers=VISION_CONCURRENCY):
+    hashes, captions = await asyncio.to_thread(find_cached_captions, processor.caption_cache, images)
+    results = await run_stages(
+        {key: (caption_image, processor, image_data)
+         for key, image_data in images.items() if key not in captions},
+        max_workers,
+    )
+    for key, value in results.items():
+        if isinstance(value, Exception):
+            continue
+        if hashes[key] is not None:
+            await asyncio.to_thread(processor.caption_cache.put, hashes[key], value)
+    return add_caption_results(captions, results)
+
+def _make_thumbnails(images):
+    return {key: make_thumbnail(image_data) for key, image_data in images.items()}
+
+async def extract_images(processor, file_bytes, file_type, pdf_doc=None, max_workers=VISION_CONCURRENCY):
+    image_objects = []
+    if file_type == "application/pdf":
+        if pdf_doc is None:
+            pdf_doc = await asyncio.to_thread(open_pdf, file_bytes)
+        occurrences, images, captioned = await asyncio.to_thread(collect_pdf_images, pdf_doc)
+        results = await caption_images(processor, {digest: images[digest] for digest in captioned}, max_workers)
+        thumbnails = await asyncio.to_thread(_make_thumbnails, images)
+        del images
+        image_objects = name_pdf_images(occurrences, thumbnails, results)
+    elif file_type in ["image/png", "image/jpeg"]:
+        image = Image.open(io.BytesIO(file_bytes))
+        thumbnail = await asyncio.to_thread(make_thumbnail, file_bytes)
+        if min(image.size) < VISION_MIN_SIDE:
+            image_objects.append((f"Small Image {len(image_objects) + 1}", thumbnail))
+        else:
+            analysis_result = (await caption_images(processor, {0: file_bytes}))[0]
+            image_name = get_image_name(analysis_result, len(image_objects) + 1)
+            image_objects.append((image_name, thumbnail))
+    return image_objects
+
+async def run_graph(graph, timings=None, disabled=()):
+    # document_pipeline.run_graph on the running loop: every node is a task that starts once
+    # the tasks of its dependencies are done
+    check_graph(graph)
+    skipped = set()
+    intervals = {}
+    tasks = {}
+
+    async def run(name):
+        dependencies, fn, *args = graph[name]
+        if dependencies:
+            await asyncio.wait([tasks[dependency] for dependency in dependencies])
+        if name in disabled or any(dependency in skipped for dependency in dependencies):
+            skipped.add(name)
+            return None
+        start = time.perf_counter()
+        try:
+            return await _timed(name, timings, fn, *args, *(tasks[dependency].result() for dependency in dependencies))
+        except Exception:
+            skipped.add(name)
+            raise
+        finally:
+            intervals[name] = (start, time.perf_counter())
+
+    for name in graph:
+        tasks[name] = asyncio.create_task(run(name))
+    values = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    return dict(zip(tasks, values)), critical_path(graph, intervals)
+
+async def _preprocess_stage(file_bytes):
+    return await asyncio.to_thread(normalize_pdf, file_bytes)
+
+async def _layout_stage(processor, prepared):
+    file_bytes, pdf_doc = prepared
+    if pdf_doc is not None and LOCAL_TEXT_FAST_PATH:
+        result = await processor.analyze_layout_local_first(file_bytes, pdf_doc)
+    else:
+        result = await processor.analyze_layout(file_bytes)
+    return result, get_result_text(result)
+
+async def _sections_stage(processor, layout):
+    result, text = layout
+    return processor.segment_sections(text, result)
+
+async def _condense_stage(max_workers, layout):
+    result, text = layout
+    return await condense_document(result, text, max_workers=max_workers)
+
+async def _combined_stage(layout):
+    result, text = layout
+    if estimate_tokens(text) > CHUNK_TOKEN_BUDGET:
+        return {}
+    try:
+        return await generate_combined_analysis(text)
+    except Exception as e:
+        report_error(f"Combined analysis failed: {str(e)}")
+        return {}
+
+async def _text_stage(name, on_update, source, combined_results=None):
+    text = source[1] if isinstance(source, tuple) else source
+    if combined_results and name in combined_results:
+        value = combined_results[name]
+        if on_update is not None:
+            on_update(name, value)
+        return value
+    if on_update is not None:
+        return await _streamed_stage(name, on_update, ASYNC_TEXT_STAGES[name], text)
+    return await ASYNC_TEXT_STAGES[name](text)
+
+async def _tables_stage(max_workers, timings, on_update, layout):
+    result, _ = layout
+    stages, table_slots, table_dataframes = plan_table_stages(result, summarize_table)
+    results = finish_stage_results(await run_stages(stages, max_workers, timings), table_slots, table_dataframes, on_update)
+    return results["table_summaries"], results["table_dataframes"]
+
+async def _images_stage(processor, file_type, on_update, prepared):
+    file_bytes, pdf_doc = prepared
+    images = await extract_images(processor, file_bytes, file_type, pdf_doc)
+    if on_update is not None:
+        on_update("images", images)
+    return images
+
+def build_document_graph(processor, file_bytes, file_type, max_workers=ANALYSIS_CONCURRENCY, combined=COMBINED_ANALYSIS,
+                         timings=None, on_update=None):
+    # document_pipeline.build_document_graph with coroutine stages; the nodes and their
+    # dependencies are the same
+    graph = {}
+    prepared = ((file_bytes, None),)
+    dependencies = ()
+    if file_type == "application/pdf":
+        graph["preprocess"] = ((), _preprocess_stage, file_bytes)
+        prepared = ()
+        dependencies = ("preprocess",)
+    graph["layout"] = (dependencies, _layout_stage, processor, *prepared)
+    graph["images"] = (dependencies, _images_stage, processor, file_type, on_update, *prepared)
+    graph["sections"] = (("layout",), _sections_stage, processor)
+    graph["condense"] = (("layout",), _condense_stage, max_workers)
+    if combined:
+        graph["combined_analysis"] = (("layout",), _combined_stage)
+    for name in TEXT_STAGES:
+        source = "condense" if name in ("overall_summary", "section_summary", "classification") else "layout"
+        graph[name] = ((source, "combined_analysis") if combined else (source,), _text_stage, name, on_update)
+    graph["tables"] = (("layout",), _tables_stage, max_workers, timings, on_update)
+    return graph
+
+async def analyze_document(processor, file_bytes, file_type, max_workers=ANALYSIS_CONCURRENCY,
+                           combined=COMBINED_ANALYSIS, include_images=True, on_update=None, disabled_stages=()):
+    # document_pipeline.analyze_document for an AsyncDocumentProcessor, returning the same dict
+    errors = []
+    timings = {}
+    trace = Trace()
+    token = _error_sink.set(errors)
+    trace_token = _trace_sink.set(trace)
+    slots_token = _openai_slots.set(asyncio.Semaphore(max(1, max_workers)))
+    try:
+        with stage_timer(timings, "total"):
+            graph = build_document_graph(processor, file_bytes, file_type, max_workers, combined, timings, on_update)
+            results, path = await run_graph(graph, timings, disabled_graph_stages(graph, disabled_stages, include_images))
+        analysis = collect_document_results(results, file_bytes)
+    finally:
+        _openai_slots.reset(slots_token)
+        _trace_sink.reset(trace_token)
+        _error_sink.reset(token)
+        export_metrics()
+    analysis.update({
+        "timings": timings,
+        "critical_path": path,
+        "trace": trace,
+        "errors": errors,
+    })
+    return analysis
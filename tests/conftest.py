@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tests import the pipeline modules from the repository root
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
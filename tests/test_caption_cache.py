@@ -0,0 +1,40 @@
+from azure.cognitiveservices.vision.computervision.models import ImageAnalysis
+
+from document_pipeline import CaptionCache
+
+def make_analysis(text):
+    return ImageAnalysis.deserialize({"description": {"captions": [{"text": text, "confidence": 0.9}]}})
+
+def caption(analysis):
+    return analysis.description.captions[0].text
+
+def test_near_duplicates_hit_and_distant_hashes_miss(tmp_path):
+    cache = CaptionCache(str(tmp_path / "captions.sqlite"), 100, 4)
+    cache.put(0b1011 << 40, make_analysis("a company logo"))
+    assert caption(cache.get((0b1011 << 40) | 0b11)) == "a company logo"
+    assert cache.get(2 ** 64 - 1) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_writers_sharing_a_file_keep_each_others_captions(tmp_path):
+    # Two connections stand in for two batch worker processes
+    path = str(tmp_path / "captions.sqlite")
+    first = CaptionCache(path, 100, 0)
+    second = CaptionCache(path, 100, 0)
+    assert first.get(1) is None and second.get(2) is None
+    first.put(1, make_analysis("stamp"))
+    second.put(2, make_analysis("signature"))
+    assert caption(first.get(2)) == "signature"
+    assert caption(second.get(1)) == "stamp"
+    assert caption(CaptionCache(path, 100, 0).get(1)) == "stamp"
+    assert first.stats()["entries"] == 2
+
+def test_least_recently_used_captions_are_evicted(tmp_path):
+    cache = CaptionCache(str(tmp_path / "captions.sqlite"), 10, 0)
+    for hash_value in range(10):
+        cache.put(hash_value << 8, make_analysis(f"image {hash_value}"))
+    assert cache.get(0) is not None
+    cache.put(10 << 8, make_analysis("image 10"))
+    assert cache.stats()["entries"] == 9
+    assert cache.get(0) is not None
+    assert cache.get(10 << 8) is not None
+    assert cache.get(1 << 8) is None
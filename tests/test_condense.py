@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import pytest
+
+import document_pipeline
+from document_pipeline import _error_sink, condense_document
+
+def make_layout(pages):
+    # One heading-free page of lines per entry, so every page becomes its own chunk
+    return SimpleNamespace(pages=[
+        SimpleNamespace(lines=[SimpleNamespace(content=line) for line in lines]) for lines in pages
+    ])
+
+@pytest.fixture
+def errors():
+    errors = []
+    token = _error_sink.set(errors)
+    yield errors
+    _error_sink.reset(token)
+
+def test_failed_chunks_fall_back_to_their_text(monkeypatch, errors):
+    def fake_response(prompt, *args, **kwargs):
+        if "FAIL" in prompt:
+            raise RuntimeError("429 Too Many Requests")
+        return "summary"
+
+    monkeypatch.setattr(document_pipeline, "generate_openai_response", fake_response)
+    pages = [[f"ok page {index} " * 60] for index in range(3)] + [["FAIL " * 120]]
+    result = make_layout(pages)
+    text = "\n".join(line for lines in pages for line in lines)
+    digest = condense_document(result, text, token_budget=200, max_workers=2)
+    assert digest.count("summary") == 3
+    assert "FAIL" in digest
+    assert len(errors) == 1 and "1 of 4 chunks" in errors[0]
+
+def test_every_chunk_failing_raises(monkeypatch, errors):
+    monkeypatch.setattr(document_pipeline, "generate_openai_response", lambda prompt, *args, **kwargs: "")
+    pages = [[f"page {index} " * 90] for index in range(3)]
+    text = "\n".join(line for lines in pages for line in lines)
+    with pytest.raises(RuntimeError, match="all 3 chunks"):
+        condense_document(make_layout(pages), text, token_budget=200, max_workers=2)
@@ -0,0 +1,42 @@
+import pytest
+
+import document_pipeline
+from document_pipeline import DocumentProcessor, LayoutCache, analyze_document
+
+from test_layout_cache import FakeLayoutClient, make_pdf
+
+SUMMARY_STAGES = ("overall_summary", "section_summary", "classification")
+VERBATIM_STAGES = ("keywords", "citations_references")
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    processor = DocumentProcessor()
+    processor.layout_cache = LayoutCache(str(tmp_path / "layout"), 64 * 1024 * 1024)
+    processor.form_recognizer_client = FakeLayoutClient()
+    monkeypatch.setattr(document_pipeline, "generate_openai_response", lambda prompt, *args, **kwargs: "answer")
+    return processor
+
+def test_failed_condense_leaves_verbatim_stages_running(processor, monkeypatch):
+    combined_calls = []
+
+    def failing_condense(*args, **kwargs):
+        raise RuntimeError("Summarizing all 3 chunks failed: 429 Too Many Requests")
+
+    monkeypatch.setattr(document_pipeline, "condense_document", failing_condense)
+    monkeypatch.setattr(document_pipeline, "generate_combined_analysis", lambda text: combined_calls.append(text) or {})
+    # Over the budget, so the combined call is not made and nothing waits for the digest
+    monkeypatch.setattr(document_pipeline, "CHUNK_TOKEN_BUDGET", 10)
+    analysis = analyze_document(processor, make_pdf(2, text_pages=(0, 1)), "application/pdf", combined=True, include_images=False)
+    assert not combined_calls
+    assert all(analysis[name] == "answer" for name in VERBATIM_STAGES)
+    assert all(analysis[name] is None for name in SUMMARY_STAGES)
+    assert any("all 3 chunks" in error for error in analysis["errors"])
+
+def test_failed_combined_call_falls_back_to_each_stage(processor, monkeypatch):
+    def failing_combined(text):
+        raise RuntimeError("400 Bad Request")
+
+    monkeypatch.setattr(document_pipeline, "generate_combined_analysis", failing_combined)
+    analysis = analyze_document(processor, make_pdf(2, text_pages=(0, 1)), "application/pdf", combined=True, include_images=False)
+    assert all(analysis[name] == "answer" for name in SUMMARY_STAGES + VERBATIM_STAGES)
+    assert analysis["errors"] == ["Combined analysis failed: 400 Bad Request"]
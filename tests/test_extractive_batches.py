@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import document_pipeline
+from document_pipeline import EXTRACTIVE_BATCH_SIZE, DocumentProcessor, plan_extractive_summaries, split_sentences
+
+class FakeLanguageClient:
+    # Returns the first sentences of each document, ranked by position, and records every request
+    def __init__(self):
+        self.requests = []
+
+    def begin_analyze_actions(self, documents, actions):
+        self.requests.append(documents)
+        results = []
+        for document in documents:
+            sentences = [
+                SimpleNamespace(text=sentence, rank_score=1 / (index + 1))
+                for index, sentence in enumerate(split_sentences(document["text"])[:3])
+            ]
+            results.append([SimpleNamespace(id=document["id"], is_error=False, sentences=sentences)])
+        return SimpleNamespace(result=lambda: results)
+
+def test_batches_stay_within_count_and_characters(monkeypatch):
+    monkeypatch.setattr(document_pipeline, "EXTRACTIVE_MAX_REQUEST_CHARS", 1000)
+    texts = {f"section {index}": f"Sentence {index} is here. " * 12 for index in range(60)}
+    summaries, remote_keys, batches = plan_extractive_summaries(texts, mode="remote")
+    assert not summaries
+    assert sorted(remote_keys) == sorted(texts)
+    for batch in batches:
+        assert len(batch) <= EXTRACTIVE_BATCH_SIZE
+        assert sum(len(document["text"]) for document in batch) <= 1000
+
+def test_long_text_is_split_and_summarized_once(monkeypatch):
+    monkeypatch.setattr(document_pipeline, "EXTRACTIVE_MAX_REQUEST_CHARS", 500)
+    long_text = " ".join(f"Long sentence number {index} goes here." for index in range(60))
+    unbroken = "x" * 1200
+    texts = {"long": long_text, "unbroken": unbroken, "short": "Short one. Short two. Short three. Short four."}
+    _, remote_keys, batches = plan_extractive_summaries(texts, mode="remote")
+    assert remote_keys.count("long") > 1 and remote_keys.count("unbroken") == 3
+    assert all(len(document["text"]) <= 500 for batch in batches for document in batch)
+
+    processor = DocumentProcessor()
+    processor.language_client = FakeLanguageClient()
+    summaries = processor.generate_extractive_summaries(texts, max_sentences=3, mode="remote")
+    assert list(summaries) == list(texts)
+    # The best three sentences across the pieces are the first of each piece, in text order
+    assert summaries["long"].startswith("Long sentence number 0 goes here.")
+    assert len(split_sentences(summaries["long"])) == 3
+    assert summaries["unbroken"].replace(" ", "") == unbroken
+    assert summaries["short"] == "Short one. Short two. Short three."
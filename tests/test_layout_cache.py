@@ -0,0 +1,56 @@
+import fitz
+import pytest
+from azure.ai.formrecognizer import AnalyzeResult
+
+from document_pipeline import DocumentProcessor, LayoutCache, build_local_layout, normalize_pdf
+
+class FakeLayoutClient:
+    # Counts Form Recognizer calls and answers with the layout of the submitted PDF's text layer
+    def __init__(self):
+        self.documents = []
+
+    def begin_analyze_document(self, model_id, document):
+        self.documents.append(document)
+        pdf_doc = fitz.open(stream=document, filetype="pdf")
+        result = AnalyzeResult.from_dict(build_local_layout(pdf_doc, range(pdf_doc.page_count)))
+        return type("Poller", (), {"result": lambda self: result})()
+
+def make_pdf(pages, text_pages=()):
+    pdf_doc = fitz.open()
+    for index in range(pages):
+        page = pdf_doc.new_page()
+        if index in text_pages:
+            page.insert_text((72, 72), f"Page {index + 1}: " + "born-digital text layer " * 4)
+    return pdf_doc.tobytes()
+
+@pytest.fixture
+def processor(tmp_path):
+    processor = DocumentProcessor()
+    processor.layout_cache = LayoutCache(str(tmp_path / "layout"), 64 * 1024 * 1024)
+    processor.form_recognizer_client = FakeLayoutClient()
+    return processor
+
+def test_compressed_upload_hits_the_cache_on_repeat(processor):
+    file_bytes = make_pdf(3, text_pages=(0, 1, 2))
+    for _ in range(2):
+        normalized, _ = normalize_pdf(file_bytes, compress=True)
+        processor.analyze_layout(normalized, shard_pages=0)
+    assert len(processor.form_recognizer_client.documents) == 1
+    assert processor.layout_cache.stats()["hits"] == 1
+
+def test_pages_needing_ocr_hit_the_cache_on_repeat(processor):
+    file_bytes = make_pdf(4, text_pages=(0, 2))
+    for _ in range(2):
+        result = processor.analyze_layout_local_first(file_bytes, check_tables=False)
+        assert [page.page_number for page in result.pages] == [1, 2, 3, 4]
+    assert len(processor.form_recognizer_client.documents) == 1
+
+def test_sharded_repeat_run_makes_no_calls(processor):
+    file_bytes = make_pdf(10, text_pages=range(10))
+    first = processor.analyze_layout(file_bytes, shard_pages=3, max_workers=2)
+    assert len(processor.form_recognizer_client.documents) == 4
+    second = processor.analyze_layout(file_bytes, shard_pages=3, max_workers=2)
+    assert len(processor.form_recognizer_client.documents) == 4
+    assert processor.layout_cache.stats()["hits"] == 4
+    assert second.content == first.content
+    assert [page.page_number for page in second.pages] == list(range(1, 11))
@@ -0,0 +1,24 @@
+import os
+
+import fitz
+
+from document_pipeline import normalize_pdf
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data")
+
+def read_pdf(name):
+    with open(os.path.join(TEST_DATA, name), "rb") as f:
+        return f.read()
+
+def test_normalize_pdf_is_deterministic():
+    file_bytes = read_pdf("output1.pdf")
+    first, _ = normalize_pdf(file_bytes, compress=True)
+    second, _ = normalize_pdf(file_bytes, compress=True)
+    assert first != file_bytes
+    assert first == second
+
+def test_normalize_pdf_keeps_well_formed_pdfs():
+    file_bytes = read_pdf("output1.pdf")
+    normalized, pdf_doc = normalize_pdf(file_bytes, compress=False)
+    assert normalized is file_bytes
+    assert pdf_doc.page_count == fitz.open(stream=file_bytes, filetype="pdf").page_count
@@ -0,0 +1,132 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import document_pipeline
+from document_pipeline import OPENAI_BACKOFF_BASE, get_backoff_delay, get_retry_after, post_with_retries
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    # Answers each POST with the next (status, headers[, delay]) of server.script, repeating the
+    # last one. The delay is waited on an Event, since the sleeps fixture replaces time.sleep.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        with server.lock:
+            server.calls.append(time.perf_counter())
+            status, headers, *delay = server.script[min(len(server.calls), len(server.script)) - 1]
+        if delay:
+            threading.Event().wait(delay[0])
+        body = b"{}"
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out and hung up
+            pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    httpd.daemon_threads = True
+    httpd.calls = []
+    httpd.lock = threading.Lock()
+    httpd.script = [(200, {})]
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/chat/completions"
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Records the backoff delays instead of waiting them out
+    delays = []
+    monkeypatch.setattr(document_pipeline.time, "sleep", delays.append)
+    return delays
+
+def test_retry_after_ms_is_honoured(server):
+    server.script = [(429, {"retry-after-ms": "150"}), (429, {"retry-after-ms": "50"}), (200, {})]
+    response = post_with_retries(server.url, json={})
+    assert response.status_code == 200
+    assert len(server.calls) == 3
+    assert server.calls[1] - server.calls[0] >= 0.15
+    assert server.calls[2] - server.calls[1] >= 0.05
+    # Full-jitter backoff could wait up to OPENAI_BACKOFF_BASE seconds; the header wins
+    assert server.calls[2] - server.calls[0] < OPENAI_BACKOFF_BASE
+
+def test_backoff_without_retry_after_uses_jitter(server, sleeps):
+    server.script = [(503, {}), (503, {}), (503, {}), (200, {})]
+    assert post_with_retries(server.url, json={}).status_code == 200
+    assert len(server.calls) == 4
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 0 <= delay <= OPENAI_BACKOFF_BASE * 2 ** attempt
+
+def test_gives_up_after_max_retries(server, sleeps):
+    server.script = [(429, {"retry-after-ms": "10"})]
+    with pytest.raises(requests.HTTPError) as error:
+        post_with_retries(server.url, max_retries=2, json={})
+    assert error.value.response.status_code == 429
+    assert len(server.calls) == 3
+    assert sleeps == [0.01, 0.01]
+
+def test_non_retryable_status_is_not_retried(server, sleeps):
+    server.script = [(400, {}), (200, {})]
+    with pytest.raises(requests.HTTPError) as error:
+        post_with_retries(server.url, json={})
+    assert error.value.response.status_code == 400
+    assert len(server.calls) == 1
+    assert sleeps == []
+
+def test_slow_responses_time_out_after_max_retries(server, sleeps, monkeypatch):
+    # No timeout argument, so the (connect, read) default applies to every attempt
+    monkeypatch.setattr(document_pipeline, "OPENAI_READ_TIMEOUT", 0.2)
+    server.script = [(200, {}, 0.5)]
+    start = time.perf_counter()
+    with pytest.raises(requests.Timeout):
+        post_with_retries(server.url, max_retries=2, json={})
+    assert len(server.calls) == 3
+    assert len(sleeps) == 2
+    assert time.perf_counter() - start < 1.5
+
+def test_slow_and_throttled_calls_recover(server, sleeps, monkeypatch):
+    monkeypatch.setattr(document_pipeline, "OPENAI_READ_TIMEOUT", 0.2)
+    server.script = [(200, {}, 0.5), (429, {"retry-after-ms": "30"}), (200, {}, 0.05)]
+    assert post_with_retries(server.url, json={}).status_code == 200
+    assert len(server.calls) == 3
+    assert sleeps[1] == 0.03
+
+def test_connection_errors_are_retried(sleeps):
+    # Nothing listens on port 9 of the loopback interface
+    with pytest.raises(requests.ConnectionError):
+        post_with_retries("http://127.0.0.1:9/chat/completions", max_retries=2, json={})
+    assert len(sleeps) == 2
+
+def test_retry_after_header_forms():
+    response = requests.Response()
+    response.headers["Retry-After"] = "2"
+    assert get_retry_after(response) == 2.0
+    response.headers["retry-after-ms"] = "250"
+    assert get_retry_after(response) == 0.25
+    response = requests.Response()
+    response.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert get_retry_after(response) == 0.0
+    assert get_retry_after(requests.Response()) is None
+
+def test_backoff_is_capped():
+    assert get_backoff_delay(0, retry_after=10_000) == document_pipeline.OPENAI_BACKOFF_CAP
+    assert get_backoff_delay(30) <= document_pipeline.OPENAI_BACKOFF_CAP
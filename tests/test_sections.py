@@ -0,0 +1,47 @@
+import re
+import sys
+
+import pytest
+
+from document_pipeline import SECTION_HEADING_PATTERN, Sections, _LINE_SPACE, find_section_spans
+
+def legacy_segment(text):
+    # DocumentProcessor.segment_sections before the span segmenter
+    sections = {}
+    current_section = "General"
+    sections[current_section] = []
+    for line in text.split("\n"):
+        if SECTION_HEADING_PATTERN.match(line):
+            current_section = line.strip().rstrip(":")
+            sections[current_section] = []
+        else:
+            sections[current_section].append(line.strip())
+    return {section: " ".join(content).strip() for section, content in sections.items() if content}
+
+def last_of_each_heading(text):
+    # Sections numbers a repeated heading; the legacy segmenter kept only its last section
+    sections = {}
+    for heading, start, end in find_section_spans(text):
+        sections[heading] = " ".join(line.strip() for line in text[start:end].split("\n")).strip()
+    return {heading: body for heading, body in sections.items() if body}
+
+TEXTS = [
+    "Intro\nWork\xa0Experience:\nDid things",
+    "Summary:\nFirst line\nSkills:\nPython\nSkills:\nGo and Rust\n2. Education\nBSc",
+    "　Contact Details:\r\nphone\r\n1. Projects Done\nA parser\nNot a heading: lower case\nskills:",
+    "Plain text only\n\n  \nwith blank lines",
+    "Heading Split:\nbody",
+]
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_matches_the_legacy_segmenter(text):
+    assert last_of_each_heading(text) == legacy_segment(text)
+
+def test_repeated_heading_keeps_every_section():
+    sections = Sections(TEXTS[1], find_section_spans(TEXTS[1]))
+    assert sections["Skills"] == "Python"
+    assert sections["Skills (2)"] == "Go and Rust"
+
+def test_line_space_is_whitespace_without_newline():
+    every_char = "".join(map(chr, range(sys.maxunicode + 1)))
+    assert set(re.findall(f"[{_LINE_SPACE}]", every_char)) == set(re.findall(r"\s", every_char)) - {"\n"}
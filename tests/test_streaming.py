@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import document_pipeline
+from document_pipeline import (
+    OPENAI_API_VERSION, Trace, _token_sink, _trace_sink, chat_request, generate_openai_response, read_chat_event,
+    stream_updates,
+)
+
+def sse(delta):
+    return b"data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": delta}}]}).encode("utf-8")
+
+def test_chat_events_forward_only_the_new_text():
+    deltas = []
+    parts = []
+    usage = {}
+    for line in [sse("Hello"), b"", sse(" world"), b'data: {"choices": [], "usage": {"total_tokens": 7}}']:
+        assert read_chat_event(line, parts, deltas.append, usage)
+    assert not read_chat_event(b"data: [DONE]", parts, deltas.append, usage)
+    assert deltas == ["Hello", " world"]
+    assert "".join(parts) == "Hello world"
+    assert usage == {"total_tokens": 7}
+
+def test_stream_updates_are_throttled(monkeypatch):
+    clock = iter([0.0, 0.01, 0.05, 0.12, 0.13, 0.3])
+    monkeypatch.setattr(document_pipeline.time, "perf_counter", lambda: next(clock))
+    updates = []
+    on_token = stream_updates("overall_summary", lambda name, text: updates.append((name, text)), interval=0.1)
+    for delta in "abcdef":
+        on_token(delta)
+    assert updates == [("overall_summary", "a"), ("overall_summary", "abcd"), ("overall_summary", "abcdef")]
+
+class FakeStream:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+@pytest.fixture
+def trace():
+    trace = Trace()
+    tokens = _trace_sink.set(trace), _token_sink.set(lambda delta: None)
+    yield trace
+    _token_sink.reset(tokens[1])
+    _trace_sink.reset(tokens[0])
+
+def test_streamed_calls_ask_for_usage():
+    _, params, _, payload = chat_request("prompt", stream=True)
+    assert payload["stream_options"] == {"include_usage": True}
+    assert params["api-version"] >= "2024-09-01-preview" > OPENAI_API_VERSION
+    _, params, _, payload = chat_request("prompt")
+    assert "stream_options" not in payload and params["api-version"] == OPENAI_API_VERSION
+
+@pytest.mark.parametrize("usage_line, expected", [
+    (b'data: {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}}',
+     {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7, "estimated": False}),
+    (None, {"prompt_tokens": 26, "completion_tokens": 3, "total_tokens": 29, "estimated": True}),
+])
+def test_stream_usage_is_recorded_or_estimated(monkeypatch, trace, usage_line, expected):
+    lines = [sse("Hello"), sse(" world"), usage_line, b"data: [DONE]"]
+    monkeypatch.setattr(document_pipeline, "post_with_retries", lambda *args, **kwargs: FakeStream([line for line in lines if line]))
+    assert generate_openai_response("x" * 100) == "Hello world"
+    assert trace.token_usage() == expected
@@ -0,0 +1,56 @@
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from azure.cognitiveservices.vision.computervision.models import ImageAnalysis
+from PIL import Image
+
+from document_pipeline import VISION_MIN_SIDE, CaptionCache, _error_sink, caption_images, prepare_vision_upload
+
+def make_png(width, height, seed=0):
+    pixels = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format="PNG")
+    return output.getvalue()
+
+def uploaded_size(image_data, **kwargs):
+    return Image.open(io.BytesIO(prepare_vision_upload(image_data, **kwargs))).size
+
+def test_large_images_are_shrunk_to_the_max_side():
+    assert max(uploaded_size(make_png(2000, 1500), max_side=1024)) == 1024
+
+def test_thin_images_keep_the_minimum_short_side():
+    width, height = uploaded_size(make_png(4000, 60), max_side=1024)
+    assert height >= VISION_MIN_SIDE
+    assert width < 4000
+
+def test_images_already_below_the_minimum_are_not_shrunk():
+    assert uploaded_size(make_png(3000, 40), max_side=1024) == (3000, 40)
+
+class FakeVisionClient:
+    # Fails on images 300 px wide, captions everything else with its width
+    def analyze_image_in_stream(self, stream, visual_features):
+        width = Image.open(stream).width
+        if width == 300:
+            raise RuntimeError("InvalidImageSize")
+        return ImageAnalysis.deserialize({"description": {"captions": [{"text": f"{width} px", "confidence": 0.9}]}})
+
+@pytest.fixture
+def errors():
+    errors = []
+    token = _error_sink.set(errors)
+    yield errors
+    _error_sink.reset(token)
+
+def test_one_failing_image_keeps_the_other_captions(tmp_path, errors):
+    processor = SimpleNamespace(
+        caption_cache=CaptionCache(str(tmp_path / "captions.sqlite"), 100, 0),
+        vision_client=FakeVisionClient(),
+    )
+    images = {name: make_png(width, 200, seed=width) for name, width in (("a", 100), ("b", 300), ("c", 500))}
+    captions = caption_images(processor, images, max_workers=3)
+    assert captions["a"].description.captions[0].text == "100 px"
+    assert captions["c"].description.captions[0].text == "500 px"
+    assert captions["b"] is None
+    assert len(errors) == 1 and "1 of 3 images" in errors[0]